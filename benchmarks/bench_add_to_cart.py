@@ -0,0 +1,146 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+from contextlib import asynccontextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:TEST-TOKEN")
+
+import asyncpg
+
+import cart
+import database
+
+# Отдельные id, чтобы не пересекаться с данными в базе; всё, что создаёт бенчмарк, откатывается
+BENCH_USER_ID = 900000001
+BENCH_RESTAURANT_ID = 900001
+BENCH_ITEMS = 10
+
+
+class CountingConnection:
+    # Считает запросы к базе; rtt добавляет к каждому сетевую задержку, как у удалённой базы
+    def __init__(self, conn, pool):
+        self.conn = conn
+        self.pool = pool
+
+    async def _run(self, method: str, query: str, *args):
+        self.pool.statements += 1
+        if self.pool.rtt:
+            await asyncio.sleep(self.pool.rtt)
+        return await getattr(self.conn, method)(query, *args)
+
+    async def fetch(self, query, *args):
+        return await self._run("fetch", query, *args)
+
+    async def fetchrow(self, query, *args):
+        return await self._run("fetchrow", query, *args)
+
+    async def fetchval(self, query, *args):
+        return await self._run("fetchval", query, *args)
+
+    async def execute(self, query, *args):
+        return await self._run("execute", query, *args)
+
+
+class CountingPool:
+    def __init__(self, conn, rtt: float):
+        self.conn = conn
+        self.rtt = rtt
+        self.statements = 0
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield CountingConnection(self.conn, self)
+
+
+async def add_item_to_cart_old(pool, user_id: int, restaurant_id: int, item_id: int, is_wine: bool = False):
+    # Прежняя последовательность запросов add_item_to_cart — только для сравнения
+    table = "vine_card" if is_wine else "menu"
+    async with pool.acquire() as conn:
+        existing_restaurant = await conn.fetchrow(
+            "SELECT restaurant_id FROM cart WHERE user_id=$1 LIMIT 1", user_id
+        )
+        if existing_restaurant and existing_restaurant["restaurant_id"] != restaurant_id:
+            raise Exception("Нельзя добавлять блюда из разных ресторанов🥲")
+        item = await conn.fetchrow(
+            f"SELECT name, price_kopecks FROM {table} WHERE restaurant_id=$1 AND id=$2", restaurant_id, item_id
+        )
+        if not item:
+            raise Exception("Товар не найден")
+        existing_item = await conn.fetchrow(
+            "SELECT count FROM cart WHERE user_id=$1 AND item_id=$2 AND restaurant_id=$3 AND is_wine=$4",
+            user_id, item_id, restaurant_id, is_wine
+        )
+        if existing_item:
+            await conn.execute(
+                "UPDATE cart SET count = count + 1 WHERE user_id=$1 AND item_id=$2 AND restaurant_id=$3 AND is_wine=$4",
+                user_id, item_id, restaurant_id, is_wine
+            )
+        else:
+            await conn.execute(
+                "INSERT INTO cart (user_id, item_id, restaurant_id, item_name, price, is_wine, count) "
+                "VALUES ($1, $2, $3, $4, $5, $6, 1)",
+                user_id, item_id, restaurant_id, item["name"], item["price_kopecks"] or 0, is_wine
+            )
+
+
+async def add_item_to_cart_new(pool, user_id: int, restaurant_id: int, item_id: int, is_wine: bool = False):
+    cart.set_db_pool(pool)
+    await cart.add_item_to_cart(user_id, restaurant_id, item_id, is_wine)
+
+
+async def bench(conn, add, adds: int, rtt: float):
+    # Корзина пустеет перед прогоном: первые добавления — вставки, остальные — увеличение количества
+    await conn.execute("DELETE FROM cart WHERE user_id = $1", BENCH_USER_ID)
+    pool = CountingPool(conn, rtt)
+    started = time.perf_counter()
+    for n in range(adds):
+        await add(pool, BENCH_USER_ID, BENCH_RESTAURANT_ID, n % BENCH_ITEMS + 1)
+    elapsed = time.perf_counter() - started
+    total = await conn.fetchval("SELECT sum(count) FROM cart WHERE user_id = $1", BENCH_USER_ID)
+    assert total == adds, f"в корзине {total} позиций вместо {adds}"
+    return pool.statements / adds, elapsed / adds * 1000
+
+
+async def run(database_url: str, adds: int, rtt: float):
+    await database.migrate(database_url.replace("postgresql://", "postgresql+asyncpg://", 1))
+    conn = await asyncpg.connect(database_url)
+    transaction = conn.transaction()
+    await transaction.start()
+    try:
+        await conn.execute(f"""
+            INSERT INTO menu (id, restaurant_id, category, category_id, name, price, price_kopecks, availability)
+            SELECT i, {BENCH_RESTAURANT_ID}, 'Категория', 1, 'Позиция ' || i, '350 ₽', 35000, TRUE
+            FROM generate_series(1, {BENCH_ITEMS}) i
+        """)
+        return {
+            "по шагам (было)": await bench(conn, add_item_to_cart_old, adds, rtt),
+            "один запрос (стало)": await bench(conn, add_item_to_cart_new, adds, rtt),
+        }
+    finally:
+        await transaction.rollback()
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Запросы к базе и время одного добавления в корзину")
+    parser.add_argument("--database-url", default=os.environ.get("TEST_DATABASE_URL", ""))
+    parser.add_argument("--adds", type=int, default=1000)
+    parser.add_argument("--rtt", type=float, default=0.0, help="сетевая задержка до базы в секундах")
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("нужен --database-url или TEST_DATABASE_URL")
+
+    logging.disable(logging.WARNING)
+    results = asyncio.run(run(args.database_url, args.adds, args.rtt))
+
+    print(f"{'вариант':24}{'запросов':>10}{'мс на добавление':>20}")
+    for name, (statements, ms) in results.items():
+        print(f"{name:24}{statements:>10.1f}{ms:>20.3f}")
+
+
+if __name__ == "__main__":
+    main()
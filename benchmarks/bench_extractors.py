@@ -0,0 +1,56 @@
+import os
+import sys
+import glob
+import time
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from item_extractor import EXTRACTORS
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "dish_pages")
+
+
+def load_pages(pages_dir: str) -> dict:
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(pages_dir, "*.html"))):
+        with open(path, encoding="utf-8") as f:
+            pages[os.path.basename(path)] = f.read()
+    return pages
+
+
+def bench(extractor, pages: dict, rounds: int) -> dict:
+    # Время разбора одной страницы в миллисекундах, лучшее из rounds прогонов
+    timings = {}
+    for name, html in pages.items():
+        best = float("inf")
+        for _ in range(rounds):
+            started = time.perf_counter()
+            extractor(html, "https://coffeemania.ru/menu/bench")
+            best = min(best, time.perf_counter() - started)
+        timings[name] = best * 1000
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время разбора страницы блюда каждым парсером")
+    parser.add_argument("--pages", default=PAGES_DIR, help="каталог с сохранёнными страницами *.html")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    pages = load_pages(args.pages)
+    results = {name: bench(extractor, pages, args.rounds) for name, extractor in EXTRACTORS.items()}
+
+    backends = list(results)
+    print(f"{'страница':32}" + "".join(f"{name:>12}" for name in backends))
+    for page in pages:
+        print(f"{page:32}" + "".join(f"{results[name][page]:>10.3f}ms" for name in backends))
+    print(f"{'среднее':32}" + "".join(
+        f"{sum(results[name].values()) / len(pages):>10.3f}ms" for name in backends
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import threading
+from contextlib import asynccontextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:TEST-TOKEN")
+
+import asyncpg
+from aiohttp.test_utils import TestServer
+from aiogram.types import Update
+
+import clients
+import database
+from fsm_storage import PostgresStorage
+from benchmarks.fake_telegram import FakeBotApi, UpdateFactory, make_bot
+
+# Отдельный диапазон user_id; созданные бенчмарком клиенты и FSM-состояния удаляются в конце
+BENCH_USER_ID = 910000000
+TICK = 0.001
+
+
+class RttConnection:
+    def __init__(self, conn, rtt: float):
+        self.conn = conn
+        self.rtt = rtt
+
+    async def fetchrow(self, query, *args):
+        await asyncio.sleep(self.rtt)
+        return await self.conn.fetchrow(query, *args)
+
+    async def execute(self, query, *args):
+        await asyncio.sleep(self.rtt)
+        return await self.conn.execute(query, *args)
+
+    async def executemany(self, query, args):
+        await asyncio.sleep(self.rtt)
+        return await self.conn.executemany(query, args)
+
+
+class RttPool:
+    # Добавляет к каждому запросу сетевую задержку, как у удалённой базы
+    def __init__(self, pool, rtt: float):
+        self.pool = pool
+        self.rtt = rtt
+
+    @asynccontextmanager
+    async def acquire(self):
+        async with self.pool.acquire() as conn:
+            yield RttConnection(conn, self.rtt)
+
+
+class BlockingUserExists:
+    # Прежний user_exists на синхронной сессии: поток бота ждёт ответа базы и не обрабатывает
+    # другие обновления. Запрос выполняется в отдельном потоке, вызывающий блокируется на .result()
+    def __init__(self, database_url: str, rtt: float):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.pool = self._call(self._create_pool(database_url))
+        self.rtt = rtt
+
+    async def _create_pool(self, database_url: str):
+        return await asyncpg.create_pool(database_url, min_size=1, max_size=1)
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def _query(self, user_id: int):
+        await asyncio.sleep(self.rtt)
+        async with self.pool.acquire() as conn:
+            return await conn.fetchrow("SELECT user_id, name FROM clients WHERE user_id = $1", user_id)
+
+    async def __call__(self, user_id: int):
+        return self._call(self._query(user_id))
+
+    def close(self):
+        self._call(self.pool.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+async def ticker(lags: list, stop: asyncio.Event):
+    # Насколько позже запланированного просыпается цикл событий
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - started - TICK)
+
+
+async def feed(bot, updates: list, rate: float):
+    # Обновления приходят равномерно, rate в секунду, как поток /start от Telegram
+    tasks = []
+    started = time.perf_counter()
+    for n, update in enumerate(updates):
+        delay = started + n / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(clients.dp.feed_update(bot, update)))
+    await asyncio.gather(*tasks)
+
+
+async def bench(database_url: str, users: int, rate: float, rtt: float, blocking: bool):
+    pool = await asyncpg.create_pool(database_url, min_size=10, max_size=10)
+    await pool.execute(f"""
+        INSERT INTO clients (user_id, surname, name, patronymic, gender, age, phone)
+        SELECT u, 'Фамилия', 'Имя', 'Отчество', 'Мужской', 30, '+7900' || u
+        FROM generate_series({BENCH_USER_ID}, {BENCH_USER_ID + users - 1}, 2) u
+        ON CONFLICT DO NOTHING
+    """)
+
+    api = FakeBotApi()
+    api_server = TestServer(api.build_app())
+    await api_server.start_server()
+    bot = make_bot(str(api_server.make_url("")))
+
+    # Половина пользователей уже зарегистрирована, остальные начинают регистрацию
+    clients.db_pool = RttPool(pool, rtt)
+    clients.fsm_storage.set_pool(clients.db_pool)
+    original_user_exists = clients.user_exists
+    blocking_user_exists = BlockingUserExists(database_url, rtt) if blocking else None
+    if blocking_user_exists:
+        clients.user_exists = blocking_user_exists
+
+    factory = UpdateFactory()
+    updates = [
+        Update.model_validate(factory.message(BENCH_USER_ID + n, "/start"), context={"bot": bot})
+        for n in range(users)
+    ]
+    lags, stop = [], asyncio.Event()
+    ticker_task = asyncio.create_task(ticker(lags, stop))
+    started = time.perf_counter()
+    try:
+        await feed(bot, updates, rate)
+        elapsed = time.perf_counter() - started
+    finally:
+        stop.set()
+        await ticker_task
+        clients.user_exists = original_user_exists
+        if blocking_user_exists:
+            blocking_user_exists.close()
+        await clients.fsm_storage.close()
+        await bot.session.close()
+        await api_server.close()
+        await pool.execute(
+            "DELETE FROM clients WHERE user_id BETWEEN $1 AND $2", BENCH_USER_ID, BENCH_USER_ID + users - 1
+        )
+        await pool.execute(
+            "DELETE FROM fsm_states WHERE split_part(key, ':', 3)::bigint BETWEEN $1 AND $2",
+            BENCH_USER_ID, BENCH_USER_ID + users - 1
+        )
+        await pool.close()
+
+    assert len(api.calls_of("sendMessage")) == users, "не на все /start пришёл ответ"
+    lags.sort()
+    return elapsed, lags[int(len(lags) * 0.99)], lags[-1]
+
+
+async def run(database_url: str, users: int, rate: float, rtt: float, compare_blocking: bool):
+    await database.migrate(database_url.replace("postgresql://", "postgresql+asyncpg://", 1))
+    if not isinstance(clients.fsm_storage, PostgresStorage):
+        clients.fsm_storage.set_pool = lambda pool: None
+    results = {"asyncpg": await bench(database_url, users, rate, rtt, blocking=False)}
+    if compare_blocking:
+        results["блокирующий"] = await bench(database_url, users, rate, rtt, blocking=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Параллельные /start в боте регистрации и задержка цикла событий")
+    parser.add_argument("--database-url", default=os.environ.get("TEST_DATABASE_URL", ""))
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=300, help="/start в секунду")
+    parser.add_argument("--rtt", type=float, default=0.002, help="сетевая задержка до базы в секундах")
+    parser.add_argument("--compare-blocking", action="store_true",
+                        help="также прогнать прежний синхронный user_exists")
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("нужен --database-url или TEST_DATABASE_URL")
+
+    logging.disable(logging.WARNING)
+    results = asyncio.run(run(args.database_url, args.users, args.rate, args.rtt, args.compare_blocking))
+
+    print(f"обновлений: {args.users}, поступают {args.rate:.0f} в секунду, задержка базы {args.rtt * 1000:.1f}ms")
+    print(f"{'вариант':16}{'время':>10}{'задержка цикла p99':>22}{'макс.':>12}")
+    for name, (elapsed, p99_lag, max_lag) in results.items():
+        print(f"{name:16}{elapsed:>9.2f}s{p99_lag * 1000:>20.1f}ms{max_lag * 1000:>10.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:TEST-TOKEN")
+
+from aiohttp.test_utils import TestServer
+from aiogram import Dispatcher
+from aiogram.types import Message
+
+import webhook
+from config1 import UPDATE_MAX_CONCURRENCY
+from scheduler import UpdateLimitMiddleware
+from benchmarks.fake_telegram import FakeBotApi, UpdateFactory, make_bot, replay
+
+
+def make_dispatcher(handler_delay: float, max_concurrency: int) -> Dispatcher:
+    # Обработчик имитирует работу с базой: ждёт handler_delay и отвечает одним сообщением.
+    # Лимит и изоляция — те же, что у main.dp
+    limiter = UpdateLimitMiddleware(max_concurrency)
+    dp = Dispatcher(events_isolation=limiter.isolation)
+    dp.update.outer_middleware(limiter)
+
+    @dp.message()
+    async def echo(message: Message):
+        await asyncio.sleep(handler_delay)
+        await message.answer("ok")
+
+    return dp
+
+
+async def bench(updates_count: int, senders: int, max_concurrency: int, handler_delay: float):
+    api = FakeBotApi()
+    api_server = TestServer(api.build_app())
+    await api_server.start_server()
+    bot = make_bot(str(api_server.make_url("")))
+    server = webhook.WebhookServer(make_dispatcher(handler_delay, max_concurrency), bot)
+    webhook_server = TestServer(server.build_app())
+    await webhook_server.start_server()
+
+    # Каждое обновление от своего пользователя, чтобы сопоставить ответ по chat_id
+    factory = UpdateFactory()
+    updates = [factory.message(user_id, "/start") for user_id in range(1, updates_count + 1)]
+    user_by_update = {update["update_id"]: update["message"]["chat"]["id"] for update in updates}
+
+    started = time.perf_counter()
+    try:
+        results = await replay(str(webhook_server.make_url(webhook.WEBHOOK_PATH)), updates,
+                               secret=webhook.WEBHOOK_SECRET, concurrency=senders)
+        await api.wait_calls(updates_count, timeout=60)
+    finally:
+        await webhook_server.close()
+        await bot.session.close()
+        await api_server.close()
+    elapsed = time.perf_counter() - started
+
+    replied_at = {int(payload["chat_id"]): at for method, payload, at in api.calls if method == "sendMessage"}
+    latencies = sorted(
+        (replied_at[user_by_update[update_id]] - sent_at) * 1000
+        for update_id, status, sent_at, _ in results if status == 200
+    )
+    failed = sum(1 for _, status, _, _ in results if status != 200)
+    return elapsed, latencies, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пропускная способность webhook на поддельном Telegram")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--senders", type=int, default=100, help="одновременных запросов от «Telegram»")
+    parser.add_argument("--max-concurrency", type=int, default=UPDATE_MAX_CONCURRENCY)
+    parser.add_argument("--handler-delay", type=float, default=0.01, help="время обработчика в секундах")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    elapsed, latencies, failed = asyncio.run(
+        bench(args.updates, args.senders, args.max_concurrency, args.handler_delay)
+    )
+
+    print(f"обновлений: {args.updates}, ошибок: {failed}, время: {elapsed:.2f}s, "
+          f"{args.updates / elapsed:.0f} обновлений/с")
+    print(f"задержка до ответа: p50 {statistics.median(latencies):.1f}ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.1f}ms, max {latencies[-1]:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import time
+import asyncio
+import itertools
+from aiohttp import web, ClientSession
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+# Локальная замена Telegram для тестов и бенчмарков: Bot API, который принимает вызовы бота,
+# и клиент, который отправляет обновления на webhook так же, как это делает Telegram
+
+TEST_TOKEN = "123456:TEST-TOKEN"
+
+
+class FakeBotApi:
+    def __init__(self):
+        self.calls = []
+        self.message_ids = itertools.count(1)
+        self.received = asyncio.Condition()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        payload = dict(await request.post())
+        self.calls.append((method, payload, time.perf_counter()))
+        async with self.received:
+            self.received.notify_all()
+        return web.json_response({"ok": True, "result": self.result(method, payload)})
+
+    def result(self, method: str, payload: dict):
+        # send* возвращают сообщение, остальные методы — True
+        if method.lower().startswith("send"):
+            return {
+                "message_id": next(self.message_ids),
+                "date": int(time.time()),
+                "chat": {"id": int(payload.get("chat_id", 0)), "type": "private"},
+                "text": payload.get("text", ""),
+            }
+        return True
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    def calls_of(self, method: str) -> list:
+        return [payload for name, payload, _ in self.calls if name == method]
+
+    async def wait_calls(self, count: int, timeout: float = 5):
+        async with self.received:
+            await asyncio.wait_for(self.received.wait_for(lambda: len(self.calls) >= count), timeout)
+
+
+def make_bot(api_url: str, token: str = TEST_TOKEN) -> Bot:
+    return Bot(token=token, session=AiohttpSession(api=TelegramAPIServer.from_base(api_url)))
+
+
+class UpdateFactory:
+    def __init__(self):
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+
+    def user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+    def message(self, user_id: int, text: str) -> dict:
+        return {
+            "update_id": next(self.update_ids),
+            "message": {
+                "message_id": next(self.message_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": self.user(user_id),
+                "text": text,
+            },
+        }
+
+    def callback(self, user_id: int, data: str) -> dict:
+        update_id = next(self.update_ids)
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": self.user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": next(self.message_ids),
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "text": "...",
+                },
+            },
+        }
+
+
+async def replay(webhook_url: str, updates: list, secret: str = "", concurrency: int = 10,
+                 session: ClientSession = None) -> list:
+    # Отправляет обновления на webhook; возвращает (update_id, статус, время отправки, время ответа)
+    own_session = session is None
+    session = session or ClientSession()
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+
+    async def post(update):
+        async with semaphore:
+            started = time.perf_counter()
+            async with session.post(webhook_url, json=update, headers=headers) as response:
+                await response.read()
+                return update["update_id"], response.status, started, time.perf_counter()
+
+    try:
+        return await asyncio.gather(*(post(update) for update in updates))
+    finally:
+        if own_session:
+            await session.close()
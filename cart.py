@@ -8,59 +8,55 @@ from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 from aiogram.types import LabeledPrice, PreCheckoutQuery, ContentType, SuccessfulPayment, InlineKeyboardButton, InlineKeyboardMarkup
 from config1 import DB_CONFIG, PAYMENT_PROVIDER_TOKEN
-from db_queries import get_menu_item_by_id, get_wine_item_by_id
-import re
+from db_queries import get_items_by_ids
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
 router = Router()
 
+ORDER_HISTORY_PAGE_SIZE = 5
+
 db_pool = None
 def set_db_pool(pool):
     global db_pool
     db_pool = pool
 
+ADD_TO_CART_QUERY = """
+    WITH other_restaurant AS (
+        SELECT 1 FROM cart WHERE user_id = $1 AND restaurant_id <> $2 LIMIT 1
+    ), item AS (
+        SELECT name, COALESCE(price_kopecks, 0) AS price
+        FROM {table}
+        WHERE id = $3 AND restaurant_id = $2 AND availability
+    ), added AS (
+        INSERT INTO cart (user_id, item_id, restaurant_id, item_name, price, is_wine, count)
+        SELECT $1, $3, $2, item.name, item.price, $4, 1
+        FROM item
+        WHERE NOT EXISTS (SELECT 1 FROM other_restaurant)
+        ON CONFLICT (user_id, item_id, restaurant_id, is_wine) DO UPDATE SET count = cart.count + 1
+        RETURNING count
+    )
+    SELECT EXISTS (SELECT 1 FROM other_restaurant) AS other_restaurant,
+           EXISTS (SELECT 1 FROM item) AS item_found,
+           (SELECT count FROM added) AS count
+"""
+
 async def add_item_to_cart(user_id: int, restaurant_id: int, item_id: int, is_wine: bool = False):
-    # Проверяем, если в корзине уже есть товары, то их restaurant_id должен совпадать с новым
+    # Проверка ресторана, поиск товара и вставка/увеличение количества — один запрос
+    table = "vine_card" if is_wine else "menu"
     async with db_pool.acquire() as conn:
-        existing_restaurant = await conn.fetchrow(
-            "SELECT restaurant_id FROM cart WHERE user_id=$1 LIMIT 1", user_id
-        )
-        if existing_restaurant and existing_restaurant["restaurant_id"] != restaurant_id:
-            raise Exception("Нельзя добавлять блюда из разных ресторанов🥲")
-
-    if is_wine:
-        item = await get_wine_item_by_id(db_pool, item_id)
-    else:
-        item = await get_menu_item_by_id(db_pool, item_id)
+        result = await conn.fetchrow(ADD_TO_CART_QUERY.format(table=table), user_id, restaurant_id, item_id, bool(is_wine))
 
-    if not item:
+    if result["other_restaurant"]:
+        raise Exception("Нельзя добавлять блюда из разных ресторанов🥲")
+    if not result["item_found"]:
         logger.error(f"Товар с id {item_id} не найден в базе.")
         raise Exception("Товар не найден")
-
-    item_name = item["name"]
-    price_str = item.get("price", "0")
-    price_digits = re.sub(r"[^\d]", "", price_str)
-    price = int(price_digits) * 100 if price_digits else 0
-
-    async with db_pool.acquire() as conn:
-        existing_item = await conn.fetchrow(
-            "SELECT count FROM cart WHERE user_id=$1 AND item_id=$2 AND restaurant_id=$3 AND is_wine=$4",
-            user_id, item_id, restaurant_id, bool(int(is_wine))
-        )
-        if existing_item:
-            await conn.execute(
-                "UPDATE cart SET count = count + 1 WHERE user_id=$1 AND item_id=$2 AND restaurant_id=$3 AND is_wine=$4",
-                user_id, item_id, restaurant_id, bool(int(is_wine))
-            )
-            logger.info(f"Увеличено количество товара {item_id} для пользователя {user_id}.")
-        else:
-            await conn.execute(
-                "INSERT INTO cart (user_id, item_id, restaurant_id, item_name, price, is_wine, count) VALUES ($1, $2, $3, $4, $5, $6, 1)",
-                user_id, item_id, restaurant_id, item_name, price, bool(int(is_wine))
-            )
-            logger.info(f"Товар {item_id} добавлен в корзину для пользователя {user_id}.")
+    if result["count"] > 1:
+        logger.info(f"Увеличено количество товара {item_id} для пользователя {user_id}.")
+    else:
+        logger.info(f"Товар {item_id} добавлен в корзину для пользователя {user_id}.")
 
 
 @router.callback_query(F.data.startswith("add_to_cart:"))
@@ -127,6 +123,12 @@ async def checkout_callback(callback: types.CallbackQuery):
         await callback.answer("Ваша корзина пуста.", show_alert=True)
         return
 
+    unavailable = await find_unavailable_items(items)
+    if unavailable:
+        names = ", ".join(i["item_name"] for i in unavailable)[:150]  # у всплывающего ответа лимит 200 символов
+        await callback.answer(f"Больше недоступны: {names}. Удалите их из корзины.", show_alert=True)
+        return
+
     total = sum(i['price'] * i['count'] for i in items)
     prices = [LabeledPrice(label="Ваш заказ", amount=total)]
 
@@ -150,59 +152,95 @@ async def process_pre_checkout(query: PreCheckoutQuery):
 
 
 async def get_cart_items(user_id: int):
-    async with db_pool.acquire() as conn:
-        rows = await conn.fetch("SELECT item_name, price, count FROM cart WHERE user_id=$1", user_id)
-        return [{"item_name": r["item_name"], "price": r["price"], "count": r["count"]} for r in rows]
-
-
-async def save_order_from_cart(user_id: int):
-    # Получаем товары корзины с нужными полями (включая id, is_wine и restaurant_id)
     async with db_pool.acquire() as conn:
         rows = await conn.fetch(
-            "SELECT id, item_name, price, count, is_wine, restaurant_id FROM cart WHERE user_id=$1",
-            user_id
+            "SELECT item_id, restaurant_id, is_wine, item_name, price, count FROM cart WHERE user_id=$1", user_id
         )
-    items = [dict(r) for r in rows]
-    if not items:
-        return None
-
-    order_id_candidate = min(item['id'] for item in items)
-
-    restaurant_id = items[0]['restaurant_id']
-
-    menu_items = []
-    wine_items = []
-    total_count = 0
-    for item in items:
-        total_count += item['count']
-        if item['is_wine']:
-            wine_items.append(f"{item['item_name']} (x{item['count']})")
-        else:
-            menu_items.append(f"{item['item_name']} (x{item['count']})")
-
-    menu_text = ", ".join(menu_items) if menu_items else ""
-    wine_text = ", ".join(wine_items) if wine_items else ""
+        return [dict(r) for r in rows]
+
+
+async def find_unavailable_items(items: list) -> list:
+    # Позиции, снятые с продажи после добавления в корзину; по одному пакетному запросу на меню и винную карту
+    unavailable = []
+    for is_wine in (False, True):
+        group = [i for i in items if i["is_wine"] == is_wine]
+        if not group:
+            continue
+        catalog = await get_items_by_ids(db_pool, group[0]["restaurant_id"], [i["item_id"] for i in group], is_wine)
+        for item in group:
+            found = catalog.get(item["item_id"])
+            if found is None or found["availability"] is False:
+                unavailable.append(item)
+    return unavailable
+
+
+SAVE_ORDER_QUERY = """
+    WITH removed AS (
+        DELETE FROM cart WHERE user_id = $1
+        RETURNING id, item_id, item_name, price, count, is_wine, restaurant_id
+    ), new_order AS (
+        INSERT INTO orders (user_id, restaurant_id, menu_items, wine_items, count)
+        SELECT $1,
+               min(restaurant_id),
+               COALESCE(string_agg(item_name || ' (x' || count || ')', ', ' ORDER BY id) FILTER (WHERE NOT is_wine), ''),
+               COALESCE(string_agg(item_name || ' (x' || count || ')', ', ' ORDER BY id) FILTER (WHERE is_wine), ''),
+               sum(count)
+        FROM removed
+        HAVING count(*) > 0
+        RETURNING order_id
+    ), lines AS (
+        INSERT INTO order_lines (order_id, line_no, user_id, restaurant_id, item_id, item_name, is_wine, price, count)
+        SELECT new_order.order_id, row_number() OVER (ORDER BY removed.id), $1, removed.restaurant_id,
+               removed.item_id, removed.item_name, removed.is_wine, removed.price, removed.count
+        FROM removed CROSS JOIN new_order
+    )
+    SELECT order_id FROM new_order
+"""
 
+async def save_order_from_cart(user_id: int):
+    # Перенос корзины в заказ и её очистка — один атомарный запрос; order_id берётся из последовательности
     async with db_pool.acquire() as conn:
-        await conn.execute("""
-                INSERT INTO orders (order_id, user_id, restaurant_id, menu_items, wine_items, count)
-                VALUES ($1, $2, $3, $4, $5, $6)
-            """, order_id_candidate, user_id, restaurant_id, menu_text, wine_text, total_count)
-
-    await clear_cart(user_id)
-
-    return order_id_candidate
+        order_id = await conn.fetchval(SAVE_ORDER_QUERY, user_id)
+    if order_id is None:
+        return None
+    logger.info(f"Заказ {order_id} сохранён, корзина пользователя {user_id} очищена.")
+    return order_id
 
 
-async def get_order_history(user_id: int) -> list:
+async def get_order_history(user_id: int, before_order_id: int = None, limit: int = ORDER_HISTORY_PAGE_SIZE) -> dict:
+    # Keyset-пагинация по (payment_date, order_id), позиции заказов страницы — одним запросом
     async with db_pool.acquire() as conn:
-        rows = await conn.fetch("""
-                SELECT order_id, payment_date, menu_items, wine_items, count
-                FROM orders
-                WHERE user_id = $1
-                ORDER BY payment_date DESC;
-            """, user_id)
-    return rows
+        if before_order_id is None:
+            rows = await conn.fetch("""
+                    SELECT order_id, payment_date, menu_items, wine_items, count
+                    FROM orders
+                    WHERE user_id = $1
+                    ORDER BY payment_date DESC, order_id DESC
+                    LIMIT $2;
+                """, user_id, limit + 1)
+        else:
+            rows = await conn.fetch("""
+                    SELECT order_id, payment_date, menu_items, wine_items, count
+                    FROM orders
+                    WHERE user_id = $1
+                      AND (payment_date, order_id) < (SELECT payment_date, order_id FROM orders WHERE order_id = $2)
+                    ORDER BY payment_date DESC, order_id DESC
+                    LIMIT $3;
+                """, user_id, before_order_id, limit + 1)
+        orders = [dict(r) for r in rows[:limit]]
+        line_rows = await conn.fetch("""
+                SELECT order_id, item_name, is_wine, price, count
+                FROM order_lines
+                WHERE order_id = ANY($1)
+                ORDER BY order_id, line_no;
+            """, [order["order_id"] for order in orders])
+
+    lines = {}
+    for line in line_rows:
+        lines.setdefault(line["order_id"], []).append(dict(line))
+    for order in orders:
+        order["lines"] = lines.get(order["order_id"], [])
+    return {"orders": orders, "has_more": len(rows) > limit}
 
 class DeleteStates(StatesGroup):
     awaiting_quantity = State()
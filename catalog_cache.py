@@ -0,0 +1,175 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from config1 import CATALOG_CACHE_TTL, CATALOG_CACHE_MAX_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Канал Postgres, через который парсер сообщает процессам бота об изменении каталога
+CATALOG_CHANNEL = "catalog_updated"
+
+# Уведомление о картинках, заменённых под тем же URL: процессы бота сбрасывают кэши по URL картинки
+IMAGES_PAYLOAD = "images"
+
+# Проверка LISTEN-соединения и пауза перед переподключением, секунды
+LISTENER_CHECK_INTERVAL = 60
+LISTENER_RETRY_DELAY = 5
+
+# Построение индекса категорий по позициям в продаже; общий для парсера и миграции
+CATEGORIES_INDEX_QUERY = """
+    INSERT INTO categories (restaurant_id, is_wine, category_id, category, item_count, sort_order)
+    SELECT restaurant_id, {is_wine}, category_id, min(category), count(*),
+           row_number() OVER (PARTITION BY restaurant_id ORDER BY min(category))
+    FROM {table}
+    WHERE availability AND {condition}
+    GROUP BY restaurant_id, category_id
+"""
+
+
+class CatalogCache:
+    def __init__(self, max_size: int = CATALOG_CACHE_MAX_SIZE, ttl: float = CATALOG_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        # key -> (expires_at, restaurant_id, value); порядок ключей = порядок использования (LRU)
+        self._data = OrderedDict()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, _, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, restaurant_id=None):
+        if restaurant_id is None and isinstance(value, dict):
+            restaurant_id = value.get("restaurant_id")
+        self._data[key] = (time.monotonic() + self.ttl, restaurant_id, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def discard(self, key):
+        self._data.pop(key, None)
+
+    def invalidate_restaurant(self, restaurant_id: int):
+        stale = [key for key, (_, rest_id, _) in self._data.items() if rest_id == restaurant_id]
+        for key in stale:
+            del self._data[key]
+        if stale:
+            logger.info(f"Кэш каталога: сброшено {len(stale)} записей ресторана {restaurant_id}")
+
+    def clear(self):
+        self._data.clear()
+
+
+catalog_cache = CatalogCache()
+# Готовые клавиатуры не устаревают по времени: ключ содержит версию каталога,
+# которая меняется при каждой записи парсера
+keyboard_cache = CatalogCache(ttl=float("inf"))
+catalog_version = 0
+
+
+async def get_or_load(key, loader, restaurant_id=None):
+    value = catalog_cache.get(key)
+    if value is not None:
+        return value
+    value = await loader()
+    # Пустой ответ не кэшируем, чтобы новая позиция или категория появилась сразу после синхронизации
+    if value:
+        catalog_cache.set(key, value, restaurant_id)
+    return value
+
+
+async def get_or_build_keyboard(key, builder):
+    versioned_key = (catalog_version,) + key
+    keyboard = keyboard_cache.get(versioned_key)
+    if keyboard is not None:
+        return keyboard
+    keyboard = await builder()
+    if keyboard is not None:
+        keyboard_cache.set(versioned_key, keyboard)
+    return keyboard
+
+
+def bump_catalog_version():
+    global catalog_version
+    catalog_version += 1
+
+
+def invalidate_restaurant(restaurant_id: int):
+    catalog_cache.invalidate_restaurant(restaurant_id)
+    bump_catalog_version()
+
+
+# Кэши по URL картинки (file_id в Telegram, путь к локальной копии); модули регистрируют их сами
+image_caches = []
+
+
+def invalidate_images():
+    for cache in image_caches:
+        cache.clear()
+
+
+def invalidate_all():
+    catalog_cache.clear()
+    invalidate_images()
+    bump_catalog_version()
+
+
+async def notify_catalog_changed(conn, restaurant_id=None):
+    await conn.execute("SELECT pg_notify($1, $2)", CATALOG_CHANNEL, str(restaurant_id or ""))
+
+
+async def notify_images_changed(conn):
+    await conn.execute("SELECT pg_notify($1, $2)", CATALOG_CHANNEL, IMAGES_PAYLOAD)
+
+
+def _on_catalog_notification(connection, pid, channel, payload):
+    if payload == IMAGES_PAYLOAD:
+        invalidate_images()
+    elif payload:
+        invalidate_restaurant(int(payload))
+    else:
+        bump_catalog_version()
+
+
+async def listen_catalog_updates(conn):
+    await conn.add_listener(CATALOG_CHANNEL, _on_catalog_notification)
+
+
+async def run_catalog_listener(connect):
+    # Держит LISTEN-соединение живым. Уведомления, пришедшие во время разрыва, потеряны,
+    # поэтому после переподключения кэш каталога и клавиатуры сбрасываются целиком
+    reconnect = False
+    while True:
+        try:
+            conn = await connect()
+        except Exception as e:
+            logger.warning(f"Не удалось подключиться для LISTEN {CATALOG_CHANNEL}: {e}")
+            await asyncio.sleep(LISTENER_RETRY_DELAY)
+            continue
+        lost = asyncio.Event()
+        conn.add_termination_listener(lambda _: lost.set())
+        try:
+            await listen_catalog_updates(conn)
+            if reconnect:
+                invalidate_all()
+                logger.info(f"LISTEN {CATALOG_CHANNEL} восстановлен, кэш каталога сброшен")
+            reconnect = True
+            while not lost.is_set():
+                try:
+                    await asyncio.wait_for(lost.wait(), LISTENER_CHECK_INTERVAL)
+                except asyncio.TimeoutError:
+                    await conn.fetchval("SELECT 1")
+            logger.warning(f"Соединение LISTEN {CATALOG_CHANNEL} закрыто сервером")
+        except Exception as e:
+            logger.warning(f"Соединение LISTEN {CATALOG_CHANNEL} потеряно: {e}")
+        finally:
+            if not conn.is_closed():
+                conn.terminate()
+        await asyncio.sleep(LISTENER_RETRY_DELAY)
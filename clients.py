@@ -1,15 +1,19 @@
 import asyncio
 from aiogram import Bot, Dispatcher, types
 from aiogram.filters import CommandStart
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import ReplyKeyboardRemove, ReplyKeyboardMarkup, KeyboardButton
-from database import SessionLocal, User
-from config1 import BOT_TOKEN
+from config1 import BOT_TOKEN, BOT_DB_POOL_MIN_SIZE, BOT_DB_POOL_MAX_SIZE
+from pools import create_pool
+from fsm_storage import create_storage, PostgresStorage
+
+db_pool = None
 
 bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+fsm_storage = create_storage()
+dp = Dispatcher(storage=fsm_storage)
+dp.shutdown.register(fsm_storage.close)
 
 class RegStates(StatesGroup):
     fio = State()
@@ -17,33 +21,23 @@ class RegStates(StatesGroup):
     age = State()
     phone = State()
 
-def user_exists(user_id: int):
-    db = SessionLocal()
-    exists = db.query(User).filter(User.user_id == user_id).first()
-    db.close()
-    return exists
+async def user_exists(user_id: int):
+    async with db_pool.acquire() as conn:
+        return await conn.fetchrow("SELECT user_id, name FROM clients WHERE user_id = $1", user_id)
 
-def add_user(user_id: int, surname: str, name: str, patronymic: str, gender: str, age: int, phone: str):
-    db = SessionLocal()
-    user = User(
-        user_id=user_id,
-        surname=surname,
-        name=name,
-        patronymic=patronymic,
-        gender=gender,
-        age=age,
-        phone=phone
-    )
-    db.add(user)
-    db.commit()
-    db.close()
+async def add_user(user_id: int, surname: str, name: str, patronymic: str, gender: str, age: int, phone: str):
+    async with db_pool.acquire() as conn:
+        await conn.execute("""
+            INSERT INTO clients(user_id, surname, name, patronymic, gender, age, phone)
+            VALUES ($1, $2, $3, $4, $5, $6, $7)
+        """, user_id, surname, name, patronymic, gender, age, phone)
 
 @dp.message(CommandStart())
 async def start_reg(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
-    if user_exists(user_id):
-        user = user_exists(user_id)
-        fio_full = f"{user.name}"
+    user = await user_exists(user_id)
+    if user:
+        fio_full = f"{user['name']}"
         await message.answer(f"👋 Привет, {fio_full}, вы уже зарегистрированы!")
         return
     await state.set_state(RegStates.fio)
@@ -102,13 +96,20 @@ async def get_phone(message: types.Message, state: FSMContext):
     await state.update_data(phone=phone)
     data = await state.get_data()
     user_id = message.from_user.id
-    add_user(user_id, data['surname'], data['name'], data['patronymic'], data['gender'], data['age'], data['phone'])
+    await add_user(user_id, data['surname'], data['name'], data['patronymic'], data['gender'], data['age'], data['phone'])
     full_name = f"{data['surname']} {data['name']}"
     await message.answer(f"✅ {full_name}, регистрация успешно завершена!", reply_markup=ReplyKeyboardRemove())
     await state.clear()
 
 async def main():
-    await dp.start_polling(bot)
+    global db_pool
+    db_pool = await create_pool("clients", BOT_DB_POOL_MIN_SIZE, BOT_DB_POOL_MAX_SIZE)
+    if isinstance(fsm_storage, PostgresStorage):
+        fsm_storage.set_pool(db_pool)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await db_pool.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -15,4 +15,30 @@ DB_CONFIG = {
     "host": DB_HOST,
     "port": DB_PORT
 }
-BASE_URL = os.environ.get("BASE_URL", "https://coffeemania.ru")
\ No newline at end of file
+BASE_URL = os.environ.get("BASE_URL", "https://coffeemania.ru")
+CATALOG_CACHE_TTL = int(os.environ.get("CATALOG_CACHE_TTL", "900"))
+CATALOG_CACHE_MAX_SIZE = int(os.environ.get("CATALOG_CACHE_MAX_SIZE", "5000"))
+PARSER_PAGE_WORKERS = int(os.environ.get("PARSER_PAGE_WORKERS", "4"))
+PARSER_ITEM_WORKERS = int(os.environ.get("PARSER_ITEM_WORKERS", "20"))
+PARSER_HOST_RATE_LIMIT = float(os.environ.get("PARSER_HOST_RATE_LIMIT", "50"))
+HTTP_CACHE_DIR = os.environ.get("HTTP_CACHE_DIR", ".http_cache")
+ITEM_EXTRACTOR = os.environ.get("ITEM_EXTRACTOR", "lxml")
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", "2"))
+RUN_PARSER_IN_BOT = os.environ.get("RUN_PARSER_IN_BOT", "1") == "1"
+BOT_DB_POOL_MIN_SIZE = int(os.environ.get("BOT_DB_POOL_MIN_SIZE", "2"))
+BOT_DB_POOL_MAX_SIZE = int(os.environ.get("BOT_DB_POOL_MAX_SIZE", "10"))
+PARSER_DB_POOL_MIN_SIZE = int(os.environ.get("PARSER_DB_POOL_MIN_SIZE", "1"))
+PARSER_DB_POOL_MAX_SIZE = int(os.environ.get("PARSER_DB_POOL_MAX_SIZE", "10"))
+FSM_STORAGE = os.environ.get("FSM_STORAGE", "postgres")
+FSM_STATE_TTL = float(os.environ.get("FSM_STATE_TTL", "86400"))
+BOT_MODE = os.environ.get("BOT_MODE", "polling")
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = os.environ.get("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8000"))
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
+UPDATE_MAX_CONCURRENCY = int(os.environ.get("UPDATE_MAX_CONCURRENCY", "100"))
+IMAGE_DIR = os.environ.get("IMAGE_DIR", "images")
+IMAGE_MAX_SIDE = int(os.environ.get("IMAGE_MAX_SIDE", "1280"))
+IMAGE_DOWNLOAD_CONCURRENCY = int(os.environ.get("IMAGE_DOWNLOAD_CONCURRENCY", "10"))
+USER_PROFILE_TTL = float(os.environ.get("USER_PROFILE_TTL", "300"))
@@ -1,30 +1,39 @@
-from sqlalchemy import create_engine, Column, BigInteger, String, Integer, Text, Boolean, DateTime, func
-from sqlalchemy.orm import sessionmaker, declarative_base
+import asyncio
+import logging
+from sqlalchemy import Column, BigInteger, String, Integer, Numeric, Text, Boolean, DateTime, UniqueConstraint, Index, func, text
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import create_async_engine
 from config1 import DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASS
+from catalog_cache import CATEGORIES_INDEX_QUERY
 
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}?sslmode=disable"
+logger = logging.getLogger(__name__)
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(bind=engine)
+# Модуль только описывает схему: подключение к базе и создание таблиц выполняются
+# явной командой `python database.py`, а не при импорте
+DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
 Base = declarative_base()
 
 class User(Base):
-    tablename = "clients"
+    __tablename__ = "clients"
     user_id = Column(BigInteger, primary_key=True)
     surname = Column(String, nullable=False)
     name = Column(String, nullable=False)
     patronymic = Column(String, nullable=False)
+    gender = Column(String)
     age = Column(Integer, nullable=False)
     phone = Column(String, nullable=False)
 
-Base.metadata.create_all(bind=engine)
 
 class Menu(Base):
-    tablename = "menu"
+    __tablename__ = "menu"
+    # Страницы категории (main.fetch_items_page); поиск позиции по id обслуживает первичный ключ
+    __table_args__ = (Index("ix_menu_category_listing", "restaurant_id", "category_id", "name", "id"),)
 
-    id = Column(Integer, primary_key=True, autoincrement=True, nullable=False)
+    id = Column(Integer, primary_key=True, autoincrement=False, nullable=False)
     category = Column(String(255))
+    category_id = Column(Integer, nullable=False, default=0)
     name = Column(String(255), nullable=False)
     price = Column(String(50))
     calories = Column(Integer)
@@ -38,13 +47,25 @@ class Menu(Base):
     image = Column(Text)
     availability = Column(Boolean, default=True)
     timetable = Column(Text)
+    # Нормализованные при загрузке значения строк price/proteins/fats/carbohydrates/weight
+    price_kopecks = Column(Integer)
+    proteins_value = Column(Numeric(10, 2))
+    fats_value = Column(Numeric(10, 2))
+    carbohydrates_value = Column(Numeric(10, 2))
+    # Вес в граммах или объём в миллилитрах — единица в weight_unit ("g" / "ml")
+    weight_value = Column(Numeric(10, 2))
+    weight_unit = Column(String(2))
+    content_hash = Column(String(64))
     restaurant_id = Column(Integer, primary_key=True, nullable=False, default=0)
 
 class VineCard(Base):
-    tablename = "vine_card"
+    __tablename__ = "vine_card"
+    # Страницы категории (main.fetch_items_page); поиск позиции по id обслуживает первичный ключ
+    __table_args__ = (Index("ix_vine_card_category_listing", "restaurant_id", "category_id", "name", "id"),)
 
-    id = Column(Integer, primary_key=True, autoincrement=True, nullable=False)
+    id = Column(Integer, primary_key=True, autoincrement=False, nullable=False)
     category = Column(String(255))
+    category_id = Column(Integer, nullable=False, default=0)
     name = Column(String(255), nullable=False)
     price = Column(String(50))
     calories = Column(Integer)
@@ -58,12 +79,32 @@ class VineCard(Base):
     image = Column(Text)
     availability = Column(Boolean, default=True)
     timetable = Column(Text)
+    # Нормализованные при загрузке значения строк price/proteins/fats/carbohydrates/weight
+    price_kopecks = Column(Integer)
+    proteins_value = Column(Numeric(10, 2))
+    fats_value = Column(Numeric(10, 2))
+    carbohydrates_value = Column(Numeric(10, 2))
+    # Вес в граммах или объём в миллилитрах — единица в weight_unit ("g" / "ml")
+    weight_value = Column(Numeric(10, 2))
+    weight_unit = Column(String(2))
+    content_hash = Column(String(64))
     restaurant_id = Column(Integer, primary_key=True, nullable=False)
 
+class Category(Base):
+    __tablename__ = "categories"
+    __table_args__ = (Index("ix_categories_listing", "restaurant_id", "is_wine", "sort_order"),)
+
+    restaurant_id = Column(Integer, primary_key=True)
+    is_wine = Column(Boolean, primary_key=True)
+    category_id = Column(Integer, primary_key=True)
+    category = Column(String(255))
+    item_count = Column(Integer, nullable=False, default=0)
+    sort_order = Column(Integer, nullable=False, default=0)
+
 class Restaurant(Base):
-    tablename = "restaurants"
+    __tablename__ = "restaurants"
 
-    restaurant_id = Column(Integer, primary_key=True, autoincrement=True)
+    restaurant_id = Column(Integer, primary_key=True, autoincrement=False)
     name = Column(Text, nullable=False)
     address = Column(Text)
     image = Column(Text)
@@ -76,16 +117,161 @@ class Restaurant(Base):
     contacts = Column(Text)
     vine_card = Column(Text)
 
-Base.metadata.create_all(bind=engine)
+
+
+class Cart(Base):
+    __tablename__ = "cart"
+    # Ключ позиции для ON CONFLICT; по префиксу user_id он же обслуживает все выборки корзины пользователя
+    __table_args__ = (UniqueConstraint("user_id", "item_id", "restaurant_id", "is_wine", name="uq_cart_position"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(BigInteger, nullable=False)
+    item_id = Column(Integer, nullable=False)
+    restaurant_id = Column(Integer, nullable=False)
+    item_name = Column(Text)
+    price = Column(Integer, nullable=False, default=0)
+    is_wine = Column(Boolean, nullable=False, default=False)
+    count = Column(Integer, nullable=False, default=1)
 
 
 class Order(Base):
-    tablename = "orders"
+    __tablename__ = "orders"
+    __table_args__ = (Index("ix_orders_user_payment_date", "user_id", text("payment_date DESC"), text("order_id DESC")),)
 
     order_id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(BigInteger, nullable=False)
     restaurant_id = Column(Integer, nullable=False)
     menu_items = Column(Text)
     wine_items = Column(Text)
+    count = Column(Integer, nullable=False, default=0)
     payment_date = Column(DateTime, nullable=False, server_default=func.now())
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+
+
+class TelegramFile(Base):
+    __tablename__ = "telegram_files"
+
+    image_url = Column(Text, primary_key=True)
+    file_id = Column(Text, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+class ImageMirror(Base):
+    __tablename__ = "image_mirror"
+
+    image_url = Column(Text, primary_key=True)
+    content_hash = Column(String(64), nullable=False)
+    path = Column(Text, nullable=False)
+
+
+class OrderLine(Base):
+    __tablename__ = "order_lines"
+
+    order_id = Column(Integer, primary_key=True)
+    line_no = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, nullable=False)
+    restaurant_id = Column(Integer, nullable=False)
+    item_id = Column(Integer, nullable=False)
+    item_name = Column(Text)
+    is_wine = Column(Boolean, nullable=False, default=False)
+    price = Column(Integer, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=1)
+
+
+class FsmState(Base):
+    __tablename__ = "fsm_states"
+    __table_args__ = (Index("ix_fsm_states_updated_at", "updated_at"),)
+
+    key = Column(Text, primary_key=True)
+    state = Column(Text)
+    data = Column(JSONB, nullable=False, server_default="{}")
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+# Дополнения для баз, созданных до появления этих колонок и ключей: create_all
+# не меняет существующие таблицы. Все операторы идемпотентны
+UPGRADE_STATEMENTS = [
+    "ALTER TABLE clients ADD COLUMN IF NOT EXISTS gender VARCHAR",
+    "ALTER TABLE menu ADD COLUMN IF NOT EXISTS category_id INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE menu ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+    "ALTER TABLE vine_card ADD COLUMN IF NOT EXISTS category_id INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE vine_card ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+    "ALTER TABLE orders ADD COLUMN IF NOT EXISTS count INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE menu ADD COLUMN IF NOT EXISTS price_kopecks INTEGER",
+    "ALTER TABLE menu ADD COLUMN IF NOT EXISTS proteins_value NUMERIC(10, 2)",
+    "ALTER TABLE menu ADD COLUMN IF NOT EXISTS fats_value NUMERIC(10, 2)",
+    "ALTER TABLE menu ADD COLUMN IF NOT EXISTS carbohydrates_value NUMERIC(10, 2)",
+    "ALTER TABLE menu ADD COLUMN IF NOT EXISTS weight_value NUMERIC(10, 2)",
+    "ALTER TABLE menu ADD COLUMN IF NOT EXISTS weight_unit VARCHAR(2)",
+    "ALTER TABLE vine_card ADD COLUMN IF NOT EXISTS price_kopecks INTEGER",
+    "ALTER TABLE vine_card ADD COLUMN IF NOT EXISTS proteins_value NUMERIC(10, 2)",
+    "ALTER TABLE vine_card ADD COLUMN IF NOT EXISTS fats_value NUMERIC(10, 2)",
+    "ALTER TABLE vine_card ADD COLUMN IF NOT EXISTS carbohydrates_value NUMERIC(10, 2)",
+    "ALTER TABLE vine_card ADD COLUMN IF NOT EXISTS weight_value NUMERIC(10, 2)",
+    "ALTER TABLE vine_card ADD COLUMN IF NOT EXISTS weight_unit VARCHAR(2)",
+    # Цены в копейках для уже загруженных позиций — до первого прогона парсера
+    """
+    UPDATE menu
+    SET price_kopecks = round(replace(substring(regexp_replace(price, '\\s', '', 'g') from '\\d+(?:[.,]\\d+)?'), ',', '.')::numeric * 100)
+    WHERE price_kopecks IS NULL
+    """,
+    """
+    UPDATE vine_card
+    SET price_kopecks = round(replace(substring(regexp_replace(price, '\\s', '', 'g') from '\\d+(?:[.,]\\d+)?'), ',', '.')::numeric * 100)
+    WHERE price_kopecks IS NULL
+    """,
+    # Индекс категорий для уже загруженных ресторанов — иначе до полного прогона парсера меню выглядит пустым
+    CATEGORIES_INDEX_QUERY.format(
+        is_wine="FALSE", table="menu",
+        condition="restaurant_id NOT IN (SELECT restaurant_id FROM categories WHERE NOT is_wine)"
+    ),
+    CATEGORIES_INDEX_QUERY.format(
+        is_wine="TRUE", table="vine_card",
+        condition="restaurant_id NOT IN (SELECT restaurant_id FROM categories WHERE is_wine)"
+    ),
+    # order_id мог быть создан без последовательности — INSERT в cart.py на неё рассчитывает
+    "CREATE SEQUENCE IF NOT EXISTS orders_order_id_seq OWNED BY orders.order_id",
+    "ALTER TABLE orders ALTER COLUMN order_id SET DEFAULT nextval('orders_order_id_seq')",
+    "SELECT setval('orders_order_id_seq', COALESCE((SELECT max(order_id) FROM orders), 0) + 1, false)",
+    # Перед уникальным ключом корзины сливаем дубликаты позиций в одну строку
+    """
+    WITH dup AS (
+        SELECT min(id) AS keep_id, sum(count) AS total
+        FROM cart
+        GROUP BY user_id, item_id, restaurant_id, is_wine
+        HAVING count(*) > 1
+    )
+    UPDATE cart SET count = dup.total FROM dup WHERE cart.id = dup.keep_id
+    """,
+    """
+    DELETE FROM cart c USING cart d
+    WHERE c.user_id = d.user_id AND c.item_id = d.item_id
+      AND c.restaurant_id = d.restaurant_id AND c.is_wine = d.is_wine
+      AND c.id > d.id
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_cart_position ON cart (user_id, item_id, restaurant_id, is_wine)",
+]
+
+
+def _create_indexes(sync_conn):
+    # create_all создаёт индексы только вместе с новой таблицей
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+
+async def migrate(database_url: str = DATABASE_URL):
+    engine = create_async_engine(database_url)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            for statement in UPGRADE_STATEMENTS:
+                await conn.exec_driver_sql(statement)
+            await conn.run_sync(_create_indexes)
+    finally:
+        await engine.dispose()
+    logger.info("Схема базы данных обновлена")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(migrate())
@@ -1,21 +1,38 @@
 import asyncpg
 
-async def get_menu_item_by_id(db_pool, item_id: int) -> dict:
+ITEM_COLUMNS = """
+    id, name, price, calories, proteins, fats, carbohydrates, weight,
+    description, allergens, availability, image, category, restaurant_id, category_id
+"""
+
+# Позиция однозначно задаётся парой (restaurant_id, id) — это первичный ключ menu и vine_card
+async def get_menu_item_by_id(db_pool, restaurant_id: int, item_id: int) -> dict:
     async with db_pool.acquire() as conn:
-        row = await conn.fetchrow("""
-            SELECT id, name, price, calories, proteins, fats, carbohydrates, weight,
-                   description, allergens, availability, image, category, restaurant_id, category_id
+        row = await conn.fetchrow(f"""
+            SELECT {ITEM_COLUMNS}
             FROM menu
-            WHERE id = $1
-        """, item_id)
+            WHERE restaurant_id = $1 AND id = $2
+        """, restaurant_id, item_id)
     return dict(row) if row else {}
 
-async def get_wine_item_by_id(db_pool, item_id: int) -> dict:
+async def get_wine_item_by_id(db_pool, restaurant_id: int, item_id: int) -> dict:
     async with db_pool.acquire() as conn:
-        row = await conn.fetchrow("""
-            SELECT id, name, price, calories, proteins, fats, carbohydrates, weight,
-                   description, allergens, availability, image, category, restaurant_id, category_id
+        row = await conn.fetchrow(f"""
+            SELECT {ITEM_COLUMNS}
             FROM vine_card
-            WHERE id = $1
-        """, item_id)
-    return dict(row) if row else {}
\ No newline at end of file
+            WHERE restaurant_id = $1 AND id = $2
+        """, restaurant_id, item_id)
+    return dict(row) if row else {}
+
+async def get_items_by_ids(db_pool, restaurant_id: int, ids: list, is_wine: bool = False) -> dict:
+    # Пакетный вариант: все позиции одним запросом, результат — {id: позиция}
+    if not ids:
+        return {}
+    table = "vine_card" if is_wine else "menu"
+    async with db_pool.acquire() as conn:
+        rows = await conn.fetch(f"""
+            SELECT {ITEM_COLUMNS}
+            FROM {table}
+            WHERE restaurant_id = $1 AND id = ANY($2::int[])
+        """, restaurant_id, list(ids))
+    return {r["id"]: dict(r) for r in rows}
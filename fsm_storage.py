@@ -0,0 +1,114 @@
+import json
+import asyncio
+import logging
+from typing import Any, Dict, Mapping, Optional
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+from aiogram.fsm.storage.memory import MemoryStorage
+from config1 import FSM_STORAGE, FSM_STATE_TTL
+
+logger = logging.getLogger(__name__)
+
+FSM_CLEANUP_INTERVAL = 600
+
+UPSERT_QUERY = """
+    INSERT INTO fsm_states (key, state, data, updated_at)
+    VALUES ($1, $2, COALESCE($3::jsonb, '{}'::jsonb), now())
+    ON CONFLICT (key) DO UPDATE
+    SET state = CASE
+            WHEN $4 THEN EXCLUDED.state
+            WHEN fsm_states.updated_at < now() - make_interval(secs => $6) THEN NULL
+            ELSE fsm_states.state
+        END,
+        data = CASE
+            WHEN $5 THEN EXCLUDED.data
+            WHEN fsm_states.updated_at < now() - make_interval(secs => $6) THEN '{}'::jsonb
+            ELSE fsm_states.data
+        END,
+        updated_at = now()
+"""
+
+
+def make_key(key: StorageKey) -> str:
+    return ":".join(str(part) for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny
+    ))
+
+
+class PostgresStorage(BaseStorage):
+    # Каждое изменение состояния сразу пишется в базу одним запросом, чтение — всегда из базы:
+    # состояние переживает перезапуск и одинаково видно всем экземплярам бота.
+    # Отложена только очистка брошенных состояний старше ttl
+    def __init__(self, pool=None, ttl: float = FSM_STATE_TTL, cleanup_interval: float = FSM_CLEANUP_INTERVAL):
+        self.pool = pool
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self._cleanup_task = None
+
+    def set_pool(self, pool):
+        self.pool = pool
+        if self._cleanup_task is None:
+            self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+
+    async def _fetch(self, key: str):
+        async with self.pool.acquire() as conn:
+            return await conn.fetchrow(
+                "SELECT state, data FROM fsm_states WHERE key = $1 AND updated_at > now() - make_interval(secs => $2)",
+                key, self.ttl
+            )
+
+    async def _write(self, key: str, state: Optional[str] = None, data: Optional[str] = None,
+                     has_state: bool = False, has_data: bool = False):
+        try:
+            async with self.pool.acquire() as conn:
+                await conn.execute(UPSERT_QUERY, key, state, data, has_state, has_data, self.ttl)
+        except Exception as e:
+            logger.error(f"Не удалось сохранить FSM-состояние {key}: {e}")
+            raise
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._write(make_key(key), state=value, has_state=True)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        row = await self._fetch(make_key(key))
+        return row["state"] if row else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        try:
+            encoded = json.dumps(dict(data), ensure_ascii=False)
+        except (TypeError, ValueError) as e:
+            logger.error(f"FSM-данные {make_key(key)} не сериализуются в JSON: {e}")
+            raise
+        await self._write(make_key(key), data=encoded, has_data=True)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = await self._fetch(make_key(key))
+        return json.loads(row["data"]) if row else {}
+
+    async def cleanup(self):
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                "DELETE FROM fsm_states WHERE updated_at < now() - make_interval(secs => $1) "
+                "OR (state IS NULL AND data = '{}'::jsonb)",
+                self.ttl
+            )
+
+    async def _cleanup_loop(self):
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            try:
+                await self.cleanup()
+            except Exception as e:
+                logger.exception(f"Ошибка очистки FSM-состояний: {e}")
+
+    async def close(self) -> None:
+        if self._cleanup_task is not None:
+            self._cleanup_task.cancel()
+            self._cleanup_task = None
+
+
+def create_storage() -> BaseStorage:
+    if FSM_STORAGE == "memory":
+        return MemoryStorage()
+    return PostgresStorage()
@@ -0,0 +1,49 @@
+import os
+import json
+import hashlib
+import logging
+import aiofiles
+from config1 import HTTP_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+def _entry_path(url: str) -> str:
+    return os.path.join(HTTP_CACHE_DIR, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".json")
+
+
+def body_hash(body: str) -> str:
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+def conditional_headers(entry: dict) -> dict:
+    headers = {}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+async def load_entry(url: str) -> dict:
+    if not HTTP_CACHE_DIR:
+        return {}
+    try:
+        async with aiofiles.open(_entry_path(url), "r", encoding="utf-8") as f:
+            return json.loads(await f.read())
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning(f"Повреждённая запись HTTP-кэша для {url}: {e}")
+        return {}
+
+
+async def save_entry(url: str, entry: dict):
+    if not HTTP_CACHE_DIR:
+        return
+    os.makedirs(HTTP_CACHE_DIR, exist_ok=True)
+    path = _entry_path(url)
+    tmp_path = path + ".tmp"
+    async with aiofiles.open(tmp_path, "w", encoding="utf-8") as f:
+        await f.write(json.dumps(dict(entry, url=url), ensure_ascii=False))
+    os.replace(tmp_path, path)
@@ -0,0 +1,125 @@
+import io
+import os
+import asyncio
+import hashlib
+import logging
+import http_cache
+from catalog_cache import CatalogCache, image_caches, notify_images_changed
+from photo_cache import forget_file_ids
+from parse_pool import run_in_pool
+from config1 import IMAGE_DIR, IMAGE_MAX_SIDE, IMAGE_DOWNLOAD_CONCURRENCY
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_JPEG_QUALITY = 85
+
+# URL картинки -> путь к локальной копии (для процессов бота)
+local_path_cache = CatalogCache(ttl=24 * 3600)
+image_caches.append(local_path_cache)
+
+
+def image_path(content_hash: str) -> str:
+    return os.path.join(IMAGE_DIR, content_hash[:2], content_hash + ".jpg")
+
+
+def make_thumbnail(data: bytes, path: str, max_side: int = IMAGE_MAX_SIDE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with Image.open(io.BytesIO(data)) as img:
+        img = img.convert("RGB")
+        img.thumbnail((max_side, max_side))
+        tmp_path = path + ".tmp"
+        img.save(tmp_path, "JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    os.replace(tmp_path, path)
+
+
+async def mirror_image(url: str, known_hash, session, semaphore, rate_limiter):
+    # Уже скачанную картинку перепроверяем условным запросом по ETag/Last-Modified из HTTP-кэша.
+    # Возвращает (url, content_hash, path), если копия новая или картинка под этим URL сменилась
+    has_copy = bool(known_hash) and os.path.exists(image_path(known_hash))
+    headers = http_cache.conditional_headers(await http_cache.load_entry(url)) if has_copy else {}
+    async with semaphore:
+        try:
+            await rate_limiter.wait(url)
+            async with session.get(url, timeout=30, headers=headers) as response:
+                if response.status == 304 and headers:
+                    return None
+                if response.status != 200:
+                    logger.error(f"Ошибка {response.status} при загрузке картинки {url}")
+                    return None
+                data = await response.read()
+                validators = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+        except Exception as e:
+            logger.exception(f"Exception при загрузке картинки {url}: {e}")
+            return None
+
+    # Одинаковые картинки под разными URL хранятся один раз
+    content_hash = hashlib.sha256(data).hexdigest()
+    path = image_path(content_hash)
+    if not os.path.exists(path):
+        try:
+            await run_in_pool(make_thumbnail, data, path)
+        except Exception as e:
+            logger.warning(f"Не удалось сделать превью для {url}: {e}")
+            return None
+    await http_cache.save_entry(url, dict(validators, content_hash=content_hash))
+    if content_hash == known_hash:
+        return None
+    return url, content_hash, path
+
+
+async def mirror_images(db_pool, session, rate_limiter):
+    if Image is None:
+        logger.warning("Pillow не установлен, локальные копии картинок не создаются.")
+        return
+    async with db_pool.acquire() as conn:
+        rows = await conn.fetch("""
+            SELECT images.image, image_mirror.content_hash
+            FROM (
+                SELECT image FROM menu
+                UNION SELECT image FROM vine_card
+                UNION SELECT image FROM restaurants
+            ) images
+            LEFT JOIN image_mirror ON image_mirror.image_url = images.image
+            WHERE images.image LIKE 'http%'
+        """)
+    if not rows:
+        return
+
+    semaphore = asyncio.Semaphore(IMAGE_DOWNLOAD_CONCURRENCY)
+    results = await asyncio.gather(*(
+        mirror_image(r["image"], r["content_hash"], session, semaphore, rate_limiter) for r in rows
+    ))
+    mirrored = [result for result in results if result]
+    known = {r["image"] for r in rows if r["content_hash"]}
+    # Картинка сменилась под тем же URL: старое превью и его file_id в Telegram больше не годятся
+    replaced = [url for url, _, _ in mirrored if url in known]
+    if mirrored:
+        async with db_pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.executemany("""
+                    INSERT INTO image_mirror (image_url, content_hash, path)
+                    VALUES ($1, $2, $3)
+                    ON CONFLICT (image_url) DO UPDATE SET content_hash = EXCLUDED.content_hash, path = EXCLUDED.path
+                """, mirrored)
+                await forget_file_ids(conn, replaced)
+            if replaced:
+                await notify_images_changed(conn)
+    logger.info(
+        f"Картинки: проверено {len(rows)}, новых {len(mirrored) - len(replaced)}, заменено {len(replaced)}."
+    )
+
+
+async def get_local_image(db_pool, image_url: str):
+    path = local_path_cache.get(image_url)
+    if path is None:
+        async with db_pool.acquire() as conn:
+            path = await conn.fetchval("SELECT path FROM image_mirror WHERE image_url = $1", image_url)
+        if not path:
+            return None
+        local_path_cache.set(image_url, path)
+    return path if os.path.exists(path) else None
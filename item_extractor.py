@@ -0,0 +1,337 @@
+import re
+import json
+import logging
+from html.parser import HTMLParser
+from bs4 import BeautifulSoup
+from config1 import BASE_URL, ITEM_EXTRACTOR
+
+try:
+    from lxml import html as lxml_html
+except ImportError:
+    lxml_html = None
+
+
+def clean_text(text: str) -> str:
+    if not text:
+        return ""
+    text = text.replace("\xa0", " ")
+    text = re.sub(r"\s+", " ", text)
+    return text.strip()
+
+
+def parse_price(raw_price: str) -> str:
+    raw_price = clean_text(raw_price)
+    raw_price = re.sub(r"\s*₽", " ₽", raw_price)
+    return raw_price
+
+
+def normalize_image_url(img_url: str) -> str:
+    if img_url != "Нет фото":
+        if img_url.lower().endswith(".svg"):
+            img_url = "Нет фото"
+        elif not img_url.startswith("http"):
+            img_url = BASE_URL + img_url
+    return img_url
+
+
+def extract_categories(html: str) -> dict:
+    soup = BeautifulSoup(html, "html.parser")
+    categories = {}
+
+    # Проходим по всем блокам категории
+    for cat_container in soup.select(".deliveryCategoryBlockWrapper.deliveryCategoryContainer"):
+        cat_title = cat_container.get("data-title", "Неизвестная категория").strip()
+        # Извлекаем data-id и преобразуем его в целое число
+        try:
+            cat_id = int(cat_container.get("data-id", 0))
+        except ValueError:
+            cat_id = 0
+
+        dish_links = []
+        for a in cat_container.find_all("a", href=True):
+            href = a["href"]
+            if "/menu/" in href:
+                if not href.startswith("http"):
+                    href = BASE_URL + href
+                dish_links.append(href)
+        dish_links = list(set(dish_links))
+        if dish_links:
+            # Сохраняем информацию по категории: ссылки и id
+            categories[cat_title] = {
+                "id": cat_id,
+                "urls": dish_links
+            }
+    return categories
+
+
+def extract_item_bs4(html: str, url: str) -> dict:
+    soup = BeautifulSoup(html, "html.parser")
+
+    item_id = None
+    script_tag = soup.find("script", type="application/ld+json")
+    if script_tag:
+        try:
+            data = json.loads(script_tag.string)
+            if isinstance(data, dict) and data.get("@type") == "Product":
+                item_id = int(data.get("sku"))
+        except Exception as E:
+            logging.warning(f"Ошибка парсинга JSON-LD для SKU на {url}: {E}")
+
+    name_tag = soup.find("h1", class_="itemTitle")
+    name = clean_text(name_tag.text) if name_tag else "Нет названия"
+
+    description_tag = soup.find("div", class_="itemDesc")
+    description = clean_text(description_tag.text) if description_tag else "Нет описания"
+
+    price_tag = soup.find("div", class_="itemPrice")
+    if price_tag:
+        raw_price = price_tag.get_text(strip=True)
+        price = parse_price(raw_price)
+    else:
+        price = "Нет цены"
+
+    nutrition_values = {}
+    nutrition_section = soup.find("div", class_="itemAboutValueContent")
+    if nutrition_section:
+        for stat in nutrition_section.find_all("div", class_="itemStat"):
+            key_tag = stat.find("span")
+            if key_tag:
+                key = clean_text(key_tag.text)
+                value = clean_text(stat.text.replace(key, ""))
+                nutrition_values[key] = value
+
+    composition = "Нет состава"
+    composition_section = soup.find("div", class_="itemAboutCompositionContent")
+    if composition_section:
+        composition_p = composition_section.find("p")
+        if composition_p:
+            composition = clean_text(composition_p.text)
+
+    allergens_section = soup.find("p", style="font-style: italic")
+    allergens = clean_text(allergens_section.text) if allergens_section else "Аллергены: отсутствуют"
+
+    img_url = "Нет фото"
+    item_image_div = soup.find("div", id="itemImage")
+    if item_image_div:
+        img_tag = item_image_div.find("img", itemprop="contentUrl")
+        if img_tag and img_tag.has_attr("src"):
+            img_url = img_tag["src"]
+    if img_url == "Нет фото":
+        slider = soup.find("div", id="itemSlider")
+        if slider:
+            first_slide = slider.find("div", class_="itemSlide")
+            if first_slide:
+                img_tag = first_slide.find("img", itemprop="contentUrl")
+                if img_tag and img_tag.has_attr("src"):
+                    img_url = img_tag["src"]
+
+    processed_img = normalize_image_url(img_url)
+    time_label = soup.find("div", class_="timeLabel")
+    timetable = time_label.get_text(strip=True) if time_label else ""
+
+    return {
+        "SKU": item_id,
+        "Название": name,
+        "Цена": price,
+        "Описание": description,
+        "Пищевая ценность": nutrition_values,
+        "Состав": composition,
+        "Аллергены": allergens,
+        "Фото": processed_img,
+        "В наличии": True,
+        "TimeTable": timetable
+    }
+
+
+def _has_class(name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def _first(nodes):
+    return nodes[0] if nodes else None
+
+
+def _text_parts(element, root=True):
+    # Аналог Tag.text из BeautifulSoup: текст потомков без комментариев, script и style
+    if isinstance(element.tag, str) and (root or element.tag not in ("script", "style")) and element.text:
+        yield element.text
+    for child in element:
+        yield from _text_parts(child, root=False)
+        if child.tail:
+            yield child.tail
+
+
+def _text(element) -> str:
+    return "".join(_text_parts(element))
+
+
+def _stripped_text(element) -> str:
+    return "".join(part.strip() for part in _text_parts(element) if part.strip())
+
+
+# Теги без закрывающей пары: html.parser в BeautifulSoup не кладёт их в стек открытых тегов
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+PARAGRAPH_CHUNK = 2048
+COMPOSITION_SECTION_RE = re.compile(r"<div\b[^>]*\bitemAboutCompositionContent\b", re.I)
+PARAGRAPH_RE = re.compile(r"<p\b", re.I)
+ALLERGENS_RE = re.compile(r"""<p\b[^>]*\bstyle\s*=\s*["']font-style: italic["']""", re.I)
+# Участки, где похожий на тег текст тегом не является
+NON_MARKUP_RE = re.compile(r"<!--.*?-->|<script\b.*?</script\s*>|<style\b.*?</style\s*>", re.I | re.S)
+
+
+class _ParagraphText(HTMLParser):
+    # Текст <p> так, как его собирает html.parser в BeautifulSoup: вложенные <div> и <p> абзац
+    # не закрывают, он длится до своего </p> или до закрытия одного из внешних тегов.
+    # libxml2 закрывает <p> раньше, поэтому lxml-дерево для этих полей не годится
+    def __init__(self, outer_tags: set):
+        super().__init__(convert_charrefs=True)
+        self.outer_tags = outer_tags
+        self.stack = []
+        self.parts = []
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if not self.done and tag not in VOID_TAGS:
+            self.stack.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        pass
+
+    def handle_endtag(self, tag):
+        if self.done or not self.stack:
+            return
+        if tag in self.stack:
+            del self.stack[len(self.stack) - 1 - self.stack[::-1].index(tag):]
+        elif tag in self.outer_tags:
+            self.stack = []
+        self.done = not self.stack
+
+    def handle_data(self, data):
+        if not self.done and self.stack and self.stack[-1] not in ("script", "style"):
+            self.parts.append(data)
+
+
+def _find_tag(pattern, html: str, non_markup: list, pos: int = 0):
+    # Первое совпадение вне комментариев, script и style
+    for match in pattern.finditer(html, pos):
+        if not any(start <= match.start() < end for start, end in non_markup):
+            return match
+    return None
+
+
+def _paragraph_text(html: str, start: int, paragraph) -> str:
+    # Разбираем исходный HTML с начала <p> кусками, пока абзац не закроется
+    parser = _ParagraphText({ancestor.tag for ancestor in paragraph.iterancestors() if isinstance(ancestor.tag, str)})
+    for offset in range(start, len(html), PARAGRAPH_CHUNK):
+        parser.feed(html[offset:offset + PARAGRAPH_CHUNK])
+        if parser.done:
+            break
+    return "".join(parser.parts)
+
+
+def extract_item_lxml(html: str, url: str) -> dict:
+    tree = lxml_html.fromstring(html)
+    non_markup = [match.span() for match in NON_MARKUP_RE.finditer(html)]
+
+    item_id = None
+    script_tag = _first(tree.xpath('//script[@type="application/ld+json"]'))
+    if script_tag is not None:
+        try:
+            data = json.loads(script_tag.text)
+            if isinstance(data, dict) and data.get("@type") == "Product":
+                item_id = int(data.get("sku"))
+        except Exception as E:
+            logging.warning(f"Ошибка парсинга JSON-LD для SKU на {url}: {E}")
+
+    name_tag = _first(tree.xpath(f"//h1[{_has_class('itemTitle')}]"))
+    name = clean_text(_text(name_tag)) if name_tag is not None else "Нет названия"
+
+    description_tag = _first(tree.xpath(f"//div[{_has_class('itemDesc')}]"))
+    description = clean_text(_text(description_tag)) if description_tag is not None else "Нет описания"
+
+    price_tag = _first(tree.xpath(f"//div[{_has_class('itemPrice')}]"))
+    if price_tag is not None:
+        price = parse_price(_stripped_text(price_tag))
+    else:
+        price = "Нет цены"
+
+    nutrition_values = {}
+    nutrition_section = _first(tree.xpath(f"//div[{_has_class('itemAboutValueContent')}]"))
+    if nutrition_section is not None:
+        for stat in nutrition_section.xpath(f".//div[{_has_class('itemStat')}]"):
+            key_tag = _first(stat.xpath(".//span"))
+            if key_tag is not None:
+                key = clean_text(_text(key_tag))
+                value = clean_text(_text(stat).replace(key, ""))
+                nutrition_values[key] = value
+
+    composition = "Нет состава"
+    composition_section = _first(tree.xpath(f"//div[{_has_class('itemAboutCompositionContent')}]"))
+    if composition_section is not None:
+        composition_p = _first(composition_section.xpath(".//p"))
+        section_start = _find_tag(COMPOSITION_SECTION_RE, html, non_markup)
+        paragraph_start = _find_tag(PARAGRAPH_RE, html, non_markup, section_start.end()) if section_start else None
+        if composition_p is not None and paragraph_start:
+            composition = clean_text(_paragraph_text(html, paragraph_start.start(), composition_p))
+
+    allergens = "Аллергены: отсутствуют"
+    allergens_section = _first(tree.xpath('//p[@style="font-style: italic"]'))
+    allergens_start = _find_tag(ALLERGENS_RE, html, non_markup)
+    if allergens_section is not None and allergens_start:
+        allergens = clean_text(_paragraph_text(html, allergens_start.start(), allergens_section))
+
+    img_url = "Нет фото"
+    item_image_div = _first(tree.xpath('//div[@id="itemImage"]'))
+    if item_image_div is not None:
+        img_tag = _first(item_image_div.xpath('.//img[@itemprop="contentUrl"]'))
+        if img_tag is not None and img_tag.get("src") is not None:
+            img_url = img_tag.get("src")
+    if img_url == "Нет фото":
+        slider = _first(tree.xpath('//div[@id="itemSlider"]'))
+        if slider is not None:
+            first_slide = _first(slider.xpath(f".//div[{_has_class('itemSlide')}]"))
+            if first_slide is not None:
+                img_tag = _first(first_slide.xpath('.//img[@itemprop="contentUrl"]'))
+                if img_tag is not None and img_tag.get("src") is not None:
+                    img_url = img_tag.get("src")
+
+    processed_img = normalize_image_url(img_url)
+    time_label = _first(tree.xpath(f"//div[{_has_class('timeLabel')}]"))
+    timetable = _stripped_text(time_label) if time_label is not None else ""
+
+    return {
+        "SKU": item_id,
+        "Название": name,
+        "Цена": price,
+        "Описание": description,
+        "Пищевая ценность": nutrition_values,
+        "Состав": composition,
+        "Аллергены": allergens,
+        "Фото": processed_img,
+        "В наличии": True,
+        "TimeTable": timetable
+    }
+
+
+EXTRACTORS = {
+    "bs4": extract_item_bs4,
+    "lxml": extract_item_lxml,
+}
+
+
+def resolve_extractor(name: str = ITEM_EXTRACTOR) -> str:
+    # Имя парсера, который будет работать на самом деле; пишется в HTTP-кэш рядом с результатом
+    if name == "lxml" and lxml_html is None:
+        logging.warning("lxml не установлен, используем BeautifulSoup (html.parser).")
+        name = "bs4"
+    if name not in EXTRACTORS:
+        raise ValueError(f"Неизвестный парсер страниц: {name}")
+    return name
+
+
+def get_extractor(name: str = ITEM_EXTRACTOR):
+    return EXTRACTORS[resolve_extractor(name)]
+
+
+def extract_item(html: str, url: str) -> dict:
+    return get_extractor()(html, url)
@@ -17,31 +17,53 @@ from aiogram.types import (
 )
 
 from aiogram.filters import Command, CommandStart
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 
 from parser import periodic_parser
-from cart import router as cart_router, set_db_pool, get_cart_items, add_item_to_cart, clear_cart, save_order_from_cart, get_order_history
+from cart import router as cart_router, set_db_pool, get_cart_items, add_item_to_cart, save_order_from_cart, get_order_history
 from db_queries import get_menu_item_by_id, get_wine_item_by_id
-from config1 import BOT_TOKEN, DB_CONFIG
+from catalog_cache import CatalogCache, get_or_load, get_or_build_keyboard, run_catalog_listener
+from config1 import BOT_TOKEN, DB_CONFIG, RUN_PARSER_IN_BOT, BOT_DB_POOL_MIN_SIZE, BOT_DB_POOL_MAX_SIZE, BOT_MODE, USER_PROFILE_TTL
+from pools import create_pool
+from fsm_storage import create_storage, PostgresStorage
+from webhook import run_webhook
+from scheduler import UpdateLimitMiddleware
+from photo_cache import get_file_id, remember_file_id, forget_file_ids
+from image_mirror import get_local_image
+from parse_pool import shutdown_pool
 
 db_pool = None
+catalog_listener = None
 
 async def connect_db():
     global db_pool
     if db_pool is None:
-        db_pool = await asyncpg.create_pool(**DB_CONFIG)
+        db_pool = await create_pool("bot", BOT_DB_POOL_MIN_SIZE, BOT_DB_POOL_MAX_SIZE)
         set_db_pool(db_pool)
+        if isinstance(fsm_storage, PostgresStorage):
+            fsm_storage.set_pool(db_pool)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+fsm_storage = create_storage()
+update_scheduler = UpdateLimitMiddleware()
+# Обновления одного пользователя идут строго по очереди: блокировка берётся до загрузки FSM-состояния
+dp = Dispatcher(storage=fsm_storage, events_isolation=update_scheduler.isolation)
+dp.shutdown.register(fsm_storage.close)
+dp.shutdown.register(shutdown_pool)
+dp.update.outer_middleware(update_scheduler)
 dp.include_router(cart_router)
 
 MAX_CAPTION_LENGTH = 1024
+# Фрагменты ответов Telegram, означающие, что сохранённый file_id больше не принимается
+STALE_FILE_ID_ERRORS = ("wrong file identifier", "wrong remote file identifier", "file reference")
+profile_cache = CatalogCache(ttl=USER_PROFILE_TTL)
+STATS_INTERVAL = 600
+ITEMS_PAGE_SIZE = 20
 
 class RegStates(StatesGroup):
     fio = State()
@@ -50,9 +72,17 @@ class RegStates(StatesGroup):
     phone = State()
 
 async def user_exists_reg(user_id: int):
+    # Имя и возраст нужны почти в каждом сценарии — держим их в коротком кэше
+    profile = profile_cache.get(user_id)
+    if profile is not None:
+        return profile
     async with db_pool.acquire() as conn:
-        row = await conn.fetchrow("SELECT user_id, name FROM clients WHERE user_id = $1", user_id)
-    return row
+        row = await conn.fetchrow("SELECT user_id, name, age FROM clients WHERE user_id = $1", user_id)
+    if not row:
+        return None
+    profile = dict(row)
+    profile_cache.set(user_id, profile)
+    return profile
 
 async def add_user(user_id: int, surname: str, name: str, patronymic: str, gender: str, age: int, phone: str):
     async with db_pool.acquire() as conn:
@@ -60,6 +90,7 @@ async def add_user(user_id: int, surname: str, name: str, patronymic: str, gende
             INSERT INTO clients(user_id, surname, name, patronymic, gender, age, phone)
             VALUES ($1, $2, $3, $4, $5, $6, $7)
         """, user_id, surname, name, patronymic, gender, age, phone)
+    profile_cache.discard(user_id)
 
 async def get_restaurants_list() -> list:
     async with db_pool.acquire() as conn:
@@ -76,50 +107,89 @@ async def get_restaurant_info(restaurant_id: int) -> dict:
         """, restaurant_id)
     return dict(row) if row else {}
 
-async def get_menu_categories(restaurant_id: int) -> list:
+async def fetch_menu_categories(restaurant_id: int) -> list:
     async with db_pool.acquire() as conn:
         rows = await conn.fetch("""
-            SELECT DISTINCT category, category_id
-            FROM menu
-            WHERE restaurant_id = $1
-            ORDER BY category;
+            SELECT category, category_id, item_count
+            FROM categories
+            WHERE restaurant_id = $1 AND is_wine = FALSE
+            ORDER BY sort_order;
         """, restaurant_id)
-    return [{"category": r["category"], "category_id": r["category_id"]} for r in rows]
-
-async def get_menu_items(restaurant_id: int, category_id: int) -> list:
-    async with db_pool.acquire() as conn:
-        rows = await conn.fetch("""
-            SELECT id, name, price, calories, proteins, fats, carbohydrates, weight, 
-                   description, allergens, availability, image, category, 
-                   restaurant_id, category_id
-            FROM menu
-            WHERE restaurant_id = $1 AND category_id = $2
-            ORDER BY name;
-        """, restaurant_id, category_id)
     return [dict(r) for r in rows]
 
-async def get_wine_categories(restaurant_id: int) -> list:
+async def get_menu_categories(restaurant_id: int) -> list:
+    return await get_or_load(
+        ("menu_categories", restaurant_id),
+        lambda: fetch_menu_categories(restaurant_id),
+        restaurant_id
+    )
+
+ITEMS_PAGE_CONDITIONS = {
+    None: ("", "name, id"),
+    "n": ("AND (name, id) > (SELECT name, id FROM {table} WHERE restaurant_id = $1 AND id = $4)", "name, id"),
+    "p": ("AND (name, id) < (SELECT name, id FROM {table} WHERE restaurant_id = $1 AND id = $4)", "name DESC, id DESC"),
+}
+
+async def fetch_items_page(restaurant_id: int, category_id: int, is_wine=False, direction=None, cursor_id=None) -> dict:
+    # Keyset-пагинация по (name, id): курсор — id первой/последней позиции страницы; снятые с продажи не показываем
+    table = "vine_card" if is_wine else "menu"
+    condition, order = ITEMS_PAGE_CONDITIONS[direction]
+    args = [restaurant_id, category_id, ITEMS_PAGE_SIZE + 1]
+    if direction:
+        args.append(cursor_id)
     async with db_pool.acquire() as conn:
-        rows = await conn.fetch("""
-            SELECT DISTINCT category, category_id
-            FROM vine_card
-            WHERE restaurant_id = $1
-            ORDER BY category;
-        """, restaurant_id)
-    return [{"category": r["category"], "category_id": r["category_id"]} for r in rows]
+        rows = await conn.fetch(f"""
+            SELECT id, name
+            FROM {table}
+            WHERE restaurant_id = $1 AND category_id = $2 AND availability {condition.format(table=table)}
+            ORDER BY {order}
+            LIMIT $3;
+        """, *args)
+    items = [dict(r) for r in rows[:ITEMS_PAGE_SIZE]]
+    has_more = len(rows) > ITEMS_PAGE_SIZE
+    if direction == "p":
+        items.reverse()
+        return {"items": items, "has_prev": has_more, "has_next": True}
+    return {"items": items, "has_prev": direction == "n", "has_next": has_more}
+
+async def get_items_page(restaurant_id: int, category_id: int, is_wine=False, direction=None, cursor_id=None) -> dict:
+    return await get_or_load(
+        ("items_page", restaurant_id, category_id, is_wine, direction, cursor_id),
+        lambda: fetch_items_page(restaurant_id, category_id, is_wine, direction, cursor_id),
+        restaurant_id
+    )
 
-async def get_wine_items(restaurant_id: int, category_id: int) -> list:
+async def get_menu_item(restaurant_id: int, item_id: int) -> dict:
+    return await get_or_load(
+        ("menu_item", restaurant_id, item_id),
+        lambda: get_menu_item_by_id(db_pool, restaurant_id, item_id),
+        restaurant_id
+    )
+
+async def fetch_wine_categories(restaurant_id: int) -> list:
     async with db_pool.acquire() as conn:
         rows = await conn.fetch("""
-            SELECT id, name, price, calories, proteins, fats, carbohydrates, weight, 
-                   description, allergens, availability, image, category, 
-                   restaurant_id, category_id
-            FROM vine_card
-            WHERE restaurant_id = $1 AND category_id = $2
-            ORDER BY name;
-        """, restaurant_id, category_id)
+            SELECT category, category_id, item_count
+            FROM categories
+            WHERE restaurant_id = $1 AND is_wine = TRUE
+            ORDER BY sort_order;
+        """, restaurant_id)
     return [dict(r) for r in rows]
 
+async def get_wine_categories(restaurant_id: int) -> list:
+    return await get_or_load(
+        ("wine_categories", restaurant_id),
+        lambda: fetch_wine_categories(restaurant_id),
+        restaurant_id
+    )
+
+async def get_wine_item(restaurant_id: int, item_id: int) -> dict:
+    return await get_or_load(
+        ("wine_item", restaurant_id, item_id),
+        lambda: get_wine_item_by_id(db_pool, restaurant_id, item_id),
+        restaurant_id
+    )
+
 
 def make_reply_menu_button() -> ReplyKeyboardMarkup:
     kb = ReplyKeyboardMarkup(
@@ -173,15 +243,48 @@ def make_categories_inline(restaurant_id: int, categories: list, is_wine=False)
     buttons.append([InlineKeyboardButton(text="Назад", callback_data=callback_back)])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def make_items_inline(items: list, is_wine=False) -> InlineKeyboardMarkup:
+def make_items_inline(restaurant_id: int, category_id: int, page: dict, is_wine=False) -> InlineKeyboardMarkup:
     buttons = []
+    items = page["items"]
     for it in items:
         if not is_wine:
-            buttons.append([InlineKeyboardButton(text=it["name"], callback_data=f"dish_menu:{it['id']}")])
+            buttons.append([InlineKeyboardButton(text=it["name"], callback_data=f"dish_menu:{restaurant_id}:{it['id']}")])
         else:
-            buttons.append([InlineKeyboardButton(text=it["name"], callback_data=f"dish_wine:{it['id']}")])
+            buttons.append([InlineKeyboardButton(text=it["name"], callback_data=f"dish_wine:{restaurant_id}:{it['id']}")])
+    page_prefix = f"page_wine:{restaurant_id}:{category_id}" if is_wine else f"page_menu:{restaurant_id}:{category_id}"
+    nav_row = []
+    if page["has_prev"]:
+        nav_row.append(InlineKeyboardButton(text="◀️", callback_data=f"{page_prefix}:p:{items[0]['id']}"))
+    if page["has_next"]:
+        nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"{page_prefix}:n:{items[-1]['id']}"))
+    if nav_row:
+        buttons.append(nav_row)
+    callback_back = f"wine:{restaurant_id}" if is_wine else f"menu:{restaurant_id}"
+    buttons.append([InlineKeyboardButton(text="Назад", callback_data=callback_back)])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+# Клавиатуры строятся один раз на версию каталога и дальше отдаются без изменений
+async def get_restaurants_keyboard():
+    async def build():
+        restaurants = await get_restaurants_list()
+        return make_restaurants_inline(restaurants) if restaurants else None
+    return await get_or_build_keyboard(("restaurants",), build)
+
+async def get_categories_keyboard(restaurant_id: int, is_wine=False):
+    async def build():
+        if is_wine:
+            categories = await get_wine_categories(restaurant_id)
+        else:
+            categories = await get_menu_categories(restaurant_id)
+        return make_categories_inline(restaurant_id, categories, is_wine) if categories else None
+    return await get_or_build_keyboard(("categories", restaurant_id, is_wine), build)
+
+async def get_items_keyboard(restaurant_id: int, category_id: int, is_wine=False, direction=None, cursor_id=None):
+    async def build():
+        page = await get_items_page(restaurant_id, category_id, is_wine, direction, cursor_id)
+        return make_items_inline(restaurant_id, category_id, page, is_wine) if page["items"] else None
+    return await get_or_build_keyboard(("items", restaurant_id, category_id, is_wine, direction, cursor_id), build)
+
 def smart_trim(text: str, max_length: int) -> str:
     if len(text) <= max_length:
         return text
@@ -224,6 +327,26 @@ def format_restaurant_info(info: dict) -> str:
     return "\n\n".join(parts)
 
 
+async def answer_photo_cached(message: Message, image_url: str, **kwargs):
+    # Повторно отправляем уже загруженный в Telegram file_id, а не URL с сайта
+    file_id = await get_file_id(db_pool, image_url)
+    if file_id:
+        try:
+            return await message.answer_photo(photo=file_id, **kwargs)
+        except TelegramBadRequest as e:
+            # Ошибки подписи, разметки и т.п. к файлу не относятся — file_id оставляем
+            if not any(marker in e.message.lower() for marker in STALE_FILE_ID_ERRORS):
+                raise
+            logger.warning(f"file_id для {image_url} больше не действителен: {e}")
+            async with db_pool.acquire() as conn:
+                await forget_file_ids(conn, [image_url])
+    local_path = await get_local_image(db_pool, image_url)
+    photo = FSInputFile(local_path) if local_path else image_url
+    sent = await message.answer_photo(photo=photo, **kwargs)
+    if sent.photo:
+        await remember_file_id(db_pool, image_url, sent.photo[-1].file_id)
+    return sent
+
 async def send_restaurant_info(message: Message, restaurant_id: int):
     info = await get_restaurant_info(restaurant_id)
     if not info:
@@ -234,8 +357,9 @@ async def send_restaurant_info(message: Message, restaurant_id: int):
     image_path = info.get("image", "")
 
     if image_path and image_path.startswith("http"):
-        await message.answer_photo(
-            photo=image_path,
+        await answer_photo_cached(
+            message,
+            image_path,
             caption=rest_text,
             parse_mode="Markdown",
             reply_markup=kb
@@ -278,8 +402,9 @@ async def send_item_info(message: Message, item: dict, is_wine=False):
     image_path = item.get("image", "")
     if image_path:
         if image_path.startswith("http"):
-            await message.answer_photo(
-                photo=image_path,
+            await answer_photo_cached(
+                message,
+                image_path,
                 caption=item_text,
                 parse_mode="Markdown",
                 reply_markup=new_kb
@@ -298,21 +423,32 @@ async def send_item_info(message: Message, item: dict, is_wine=False):
         )
 
 async def send_menu_categories(message: Message, restaurant_id: int):
-    categories = await get_menu_categories(restaurant_id)
-    if not categories:
+    inline_kb = await get_categories_keyboard(restaurant_id, is_wine=False)
+    if not inline_kb:
         await message.answer("Меню пока пустое.")
         return
-    inline_kb = make_categories_inline(restaurant_id, categories, is_wine=False)
     await message.answer("Выберите категорию меню:", reply_markup=inline_kb)
 
 async def send_wine_categories(message: Message, restaurant_id: int):
-    categories = await get_wine_categories(restaurant_id)
-    if not categories:
+    inline_kb = await get_categories_keyboard(restaurant_id, is_wine=True)
+    if not inline_kb:
         await message.answer("Винная карта пока пуста.")
         return
-    inline_kb = make_categories_inline(restaurant_id, categories, is_wine=True)
     await message.answer("Выберите категорию вин:", reply_markup=inline_kb)
 
+async def send_category_items(message: Message, restaurant_id: int, category_id: int, is_wine=False):
+    inline_kb = await get_items_keyboard(restaurant_id, category_id, is_wine)
+    if not inline_kb:
+        if is_wine:
+            await message.answer("В этой категории пока нет напитков.")
+        else:
+            await message.answer("В этой категории пока нет блюд.")
+        return
+    if is_wine:
+        await message.answer("🍷 Винная карта выбранной категории:", reply_markup=inline_kb)
+    else:
+        await message.answer("🍽 Меню выбранной категории:", reply_markup=inline_kb)
+
 
 @dp.message(CommandStart())
 async def start_command(message: Message, state: FSMContext):
@@ -448,34 +584,51 @@ async def show_inline_main_menu(message: Message):
 
 @dp.callback_query(lambda c: c.data == "choose_restaurant")
 async def cb_choose_restaurant(callback: types.CallbackQuery):
-    restaurants = await get_restaurants_list()
-    if not restaurants:
+    inline_kb = await get_restaurants_keyboard()
+    if not inline_kb:
         await callback.message.answer("Нет ресторанов в базе.")
     else:
-        inline_kb = make_restaurants_inline(restaurants)
         await callback.message.answer("Выберите ресторан:", reply_markup=inline_kb)
     await callback.answer()
 
-@dp.callback_query(lambda c: c.data == "order_history")
-async def cb_order_history(callback: types.CallbackQuery):
-    orders = await get_order_history(callback.from_user.id)
+def format_order(order: dict) -> str:
+    order_date = order['payment_date'].strftime('%d.%m.%Y %H:%M')
+    if order["lines"]:
+        menu_items = ", ".join(f"{l['item_name']} (x{l['count']})" for l in order["lines"] if not l["is_wine"])
+        wine_items = ", ".join(f"{l['item_name']} (x{l['count']})" for l in order["lines"] if l["is_wine"])
+    else:
+        # Заказы, оформленные до появления order_lines
+        menu_items = order['menu_items']
+        wine_items = order['wine_items']
+    return (
+        f"📝 Заказ {order['order_id']} от {order_date}\n"
+        f"🍽 Меню: {menu_items or 'нет'}\n"
+        f"🍷 Винная карта: {wine_items or 'нет'}\n"
+        f"🔢 Количество: {order['count']}\n\n"
+    )
+
+async def send_order_history(message: Message, user_id: int, before_order_id: int = None):
+    history = await get_order_history(user_id, before_order_id)
+    orders = history["orders"]
     if not orders:
-        text = "У вас пока нет истории заказов."
+        text = "У вас пока нет истории заказов." if before_order_id is None else "Более ранних заказов нет."
     else:
-        text = "История ваших заказов:\n\n"
+        text = "История ваших заказов:\n\n" if before_order_id is None else ""
         for order in orders:
-            order_date = order['payment_date'].strftime('%d.%m.%Y %H:%M')
-            text += (
-                f"📝 Заказ {order['order_id']} от {order_date}\n"
-                f"🍽 Меню: {order['menu_items'] or 'нет'}\n"
-                f"🍷 Винная карта: {order['wine_items'] or 'нет'}\n"
-                f"🔢 Количество: {order['count']}\n\n"
-            )
+            text += format_order(order)
 
-    kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Назад", callback_data="back_to_inline_main_menu")]
-    ])
-    await callback.message.answer(text, reply_markup=kb)  # <-- Изменено
+    buttons = []
+    if history["has_more"]:
+        buttons.append([InlineKeyboardButton(text="Более ранние заказы", callback_data=f"order_history:{orders[-1]['order_id']}")])
+    buttons.append([InlineKeyboardButton(text="Назад", callback_data="back_to_inline_main_menu")])
+    await message.answer(text, reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
+
+@dp.callback_query(lambda c: c.data == "order_history" or c.data.startswith("order_history:"))
+async def cb_order_history(callback: types.CallbackQuery):
+    before_order_id = None
+    if ":" in callback.data:
+        before_order_id = int(callback.data.split(":", 1)[1])
+    await send_order_history(callback.message, callback.from_user.id, before_order_id)
     await callback.answer()
 
 @dp.callback_query(lambda c: c.data == "back_to_inline_main_menu")
@@ -495,12 +648,11 @@ async def cb_rest_info(callback: types.CallbackQuery):
 
 @dp.callback_query(lambda c: c.data == "back_to_restaurants_list")
 async def cb_back_to_restaurants_list(callback: types.CallbackQuery):
-    restaurants = await get_restaurants_list()
-    if not restaurants:
+    kb = await get_restaurants_keyboard()
+    if not kb:
         await callback.message.delete()
         await callback.message.answer("Нет ресторанов в базе.")
     else:
-        kb = make_restaurants_inline(restaurants)
         await callback.message.delete()
         await callback.message.answer("Выберите ресторан:", reply_markup=kb)
     await callback.answer()
@@ -518,8 +670,7 @@ async def menu_callback(callback: types.CallbackQuery):
 async def wine_callback(callback: types.CallbackQuery):
     restaurant_id = int(callback.data.split(":")[1])
     user_id = callback.from_user.id
-    async with db_pool.acquire() as conn:
-        user_info = await conn.fetchrow("SELECT age FROM clients WHERE user_id = $1", user_id)
+    user_info = await user_exists_reg(user_id)
     # Если возраст меньше 18, отправляем сообщение с отказом
     if user_info and user_info["age"] < 18:
         await callback.message.answer("Вам меньше 18 лет, просмотр винной карты недоступен!😠")
@@ -535,17 +686,7 @@ async def cat_menu_callback(callback: types.CallbackQuery):
     _, rest_id_str, cat_id_str = callback.data.split(":")
     restaurant_id = int(rest_id_str)
     category_id = int(cat_id_str)
-    items = await get_menu_items(restaurant_id, category_id)
-    if not items:
-        await callback.message.answer("В этой категории пока нет блюд.")
-    else:
-        inline_kb = make_items_inline(items, is_wine=False)
-        back_btn = InlineKeyboardButton(
-            text="Назад",
-            callback_data=f"menu:{restaurant_id}"
-        )
-        inline_kb.inline_keyboard.append([back_btn])
-        await callback.message.answer("🍽 Меню выбранной категории:", reply_markup=inline_kb)
+    await send_category_items(callback.message, restaurant_id, category_id, is_wine=False)
     await callback.answer()
 
 @dp.callback_query(lambda c: c.data.startswith("cat_wine:"))
@@ -553,25 +694,40 @@ async def cat_wine_callback(callback: types.CallbackQuery):
     _, rest_id_str, cat_id_str = callback.data.split(":")
     restaurant_id = int(rest_id_str)
     category_id = int(cat_id_str)
-    items = await get_wine_items(restaurant_id, category_id)
-    if not items:
-        await callback.message.answer("В этой категории пока нет напитков.")
+    await send_category_items(callback.message, restaurant_id, category_id, is_wine=True)
+    await callback.answer()
+
+
+@dp.callback_query(lambda c: c.data.startswith("page_menu:") or c.data.startswith("page_wine:"))
+async def items_page_callback(callback: types.CallbackQuery):
+    prefix, rest_id_str, cat_id_str, direction, cursor_str = callback.data.split(":")
+    restaurant_id = int(rest_id_str)
+    category_id = int(cat_id_str)
+    is_wine = prefix == "page_wine"
+    inline_kb = await get_items_keyboard(restaurant_id, category_id, is_wine, direction, int(cursor_str))
+    if inline_kb:
+        await callback.message.edit_reply_markup(reply_markup=inline_kb)
     else:
-        inline_kb = make_items_inline(items, is_wine=True)
-        back_btn = InlineKeyboardButton(
-            text="Назад",
-            callback_data=f"wine:{restaurant_id}"
-        )
-        inline_kb.inline_keyboard.append([back_btn])
-        await callback.message.answer("🍷 Винная карта выбранной категории:", reply_markup=inline_kb)
+        # Позиция-курсор пропала после синхронизации — начинаем категорию заново
+        await send_category_items(callback.message, restaurant_id, category_id, is_wine)
     await callback.answer()
 
+def parse_dish_callback(data: str):
+    # Клавиатуры, отправленные до появления ресторана в callback, присылают dish_menu:{id}
+    parts = data.split(":")
+    if len(parts) != 3:
+        return None
+    return int(parts[1]), int(parts[2])
+
+OUTDATED_KEYBOARD_TEXT = "Меню обновилось — откройте категорию заново."
 
 @dp.callback_query(lambda c: c.data.startswith("dish_menu:"))
 async def dish_menu_callback(callback: types.CallbackQuery):
-    _, item_id_str = callback.data.split(":", 1)
-    item_id = int(item_id_str)
-    dish = await get_menu_item_by_id(db_pool, item_id)
+    ids = parse_dish_callback(callback.data)
+    if ids is None:
+        await callback.answer(OUTDATED_KEYBOARD_TEXT, show_alert=True)
+        return
+    dish = await get_menu_item(*ids)
     if dish:
         await send_item_info(callback.message, dish, is_wine=False)
     else:
@@ -580,9 +736,11 @@ async def dish_menu_callback(callback: types.CallbackQuery):
 
 @dp.callback_query(lambda c: c.data.startswith("dish_wine:"))
 async def dish_wine_callback(callback: types.CallbackQuery):
-    _, item_id_str = callback.data.split(":", 1)
-    item_id = int(item_id_str)
-    wine = await get_wine_item_by_id(db_pool, item_id)
+    ids = parse_dish_callback(callback.data)
+    if ids is None:
+        await callback.answer(OUTDATED_KEYBOARD_TEXT, show_alert=True)
+        return
+    wine = await get_wine_item(*ids)
     if wine:
         await send_item_info(callback.message, wine, is_wine=True)
     else:
@@ -595,17 +753,7 @@ async def back_to_category_menu_callback(callback: types.CallbackQuery):
     _, rest_id_str, cat_id_str = callback.data.split(":")
     restaurant_id = int(rest_id_str)
     category_id = int(cat_id_str)
-    items = await get_menu_items(restaurant_id, category_id)
-    if not items:
-        await callback.message.answer("В этой категории пока нет блюд.")
-    else:
-        inline_kb = make_items_inline(items, is_wine=False)
-        back_btn = InlineKeyboardButton(
-            text="Назад",
-            callback_data=f"menu:{restaurant_id}"
-        )
-        inline_kb.inline_keyboard.append([back_btn])
-        await callback.message.answer("🍽 Меню выбранной категории:", reply_markup=inline_kb)
+    await send_category_items(callback.message, restaurant_id, category_id, is_wine=False)
     await callback.answer()
 
 @dp.callback_query(lambda c: c.data.startswith("back_to_category_wine:"))
@@ -613,33 +761,37 @@ async def back_to_category_wine_callback(callback: types.CallbackQuery):
     _, rest_id_str, cat_id_str = callback.data.split(":")
     restaurant_id = int(rest_id_str)
     category_id = int(cat_id_str)
-    items = await get_wine_items(restaurant_id, category_id)
-    if not items:
-        await callback.message.answer("В этой категории пока нет вин/напитков.")
-    else:
-        inline_kb = make_items_inline(items, is_wine=True)
-        back_btn = InlineKeyboardButton(
-            text="Назад",
-            callback_data=f"wine:{restaurant_id}"
-        )
-        inline_kb.inline_keyboard.append([back_btn])
-        await callback.message.answer("🍷 Винная карта выбранной категории:", reply_markup=inline_kb)
+    await send_category_items(callback.message, restaurant_id, category_id, is_wine=True)
     await callback.answer()
 
 @dp.message(F.successful_payment)
 async def successful_payment_handler(message: Message):
     logger.info(f"Получен успешный платеж: {message.successful_payment}")
     order_id = await save_order_from_cart(message.from_user.id)
-    await clear_cart(message.from_user.id)
     user = await user_exists_reg(message.from_user.id)
     user_name = user["name"]
-    await message.answer(
-        f"✅ *Платеж прошёл успешно!*\n\n"
-        f"💰 *Сумма платежа:* {message.successful_payment.total_amount // 100} {message.successful_payment.currency}\n"
-        f"🆔 *Номер заказа:* {order_id}\n\n"
-        f"Спасибо, {user_name}, что выбрали Coffemania!\n"
-        f"Ваш заказ принят и скоро начнёт готовиться😇"
-    )
+    payment = message.successful_payment
+    if order_id is None:
+        # Корзина уже пуста — например, повторное уведомление о том же платеже.
+        # Деньги списаны, поэтому номер заказа не выдумываем, а оставляем код платежа для поддержки
+        logger.error(
+            f"Платеж без корзины: пользователь {message.from_user.id}, "
+            f"telegram_payment_charge_id={payment.telegram_payment_charge_id}"
+        )
+        await message.answer(
+            f"✅ *Платеж прошёл успешно!*\n\n"
+            f"💰 *Сумма платежа:* {payment.total_amount // 100} {payment.currency}\n\n"
+            f"{user_name}, товаров в корзине не нашлось, поэтому заказ не оформлен. "
+            f"Напишите, пожалуйста, в поддержку и укажите код платежа: {payment.telegram_payment_charge_id}"
+        )
+    else:
+        await message.answer(
+            f"✅ *Платеж прошёл успешно!*\n\n"
+            f"💰 *Сумма платежа:* {payment.total_amount // 100} {payment.currency}\n"
+            f"🆔 *Номер заказа:* {order_id}\n\n"
+            f"Спасибо, {user_name}, что выбрали Coffemania!\n"
+            f"Ваш заказ принят и скоро начнёт готовиться😇"
+        )
 
     await message.answer(
         "Вы можете снова открыть «Меню» для дальнейших действий.",
@@ -651,11 +803,28 @@ async def set_main_menu():
     commands = [BotCommand(command="start", description="Начать работу")]
     await bot.set_my_commands(commands)
 
+async def start_catalog_listener():
+    global catalog_listener
+    if catalog_listener is None:
+        catalog_listener = asyncio.create_task(run_catalog_listener(lambda: asyncpg.connect(**DB_CONFIG)))
+
+async def report_stats():
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        db_pool.log_stats()
+        update_scheduler.log_stats()
+
 async def start_bot():
     await connect_db()
+    await start_catalog_listener()
     await set_main_menu()
-    asyncio.create_task(periodic_parser())
-    await dp.start_polling(bot)
+    if RUN_PARSER_IN_BOT:
+        asyncio.create_task(periodic_parser())
+    asyncio.create_task(report_stats())
+    if BOT_MODE == "webhook":
+        await run_webhook(dp, bot)
+    else:
+        await dp.start_polling(bot)
 
 async def main():
     await start_bot()
@@ -0,0 +1,29 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from config1 import PARSE_WORKERS
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if PARSE_WORKERS <= 0:
+        return None
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+    return _executor
+
+
+async def run_in_pool(func, *args):
+    # В процесс уходят только сырой HTML и обратно простые dict — цикл бота не блокируется разбором
+    executor = get_executor()
+    if executor is None:
+        return func(*args)
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+
+def shutdown_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -1,39 +1,55 @@
 import asyncio
+import sys
 import aiohttp
-import asyncpg
 import logging
 import random
 import os
 import re
 import json
+import hashlib
+from decimal import Decimal
 import aiofiles
-from bs4 import BeautifulSoup
 from playwright.async_api import async_playwright
-from config1 import DB_CONFIG, BASE_URL
+from urllib.parse import urlparse
+from config1 import (PARSER_PAGE_WORKERS, PARSER_ITEM_WORKERS, PARSER_HOST_RATE_LIMIT,
+                     PARSER_DB_POOL_MIN_SIZE, PARSER_DB_POOL_MAX_SIZE)
+from pools import create_pool
 from rest import get_links
-
-MAX_CONCURRENT_REQUESTS = 20
+from catalog_cache import invalidate_restaurant, notify_catalog_changed, CATEGORIES_INDEX_QUERY
+from photo_cache import forget_file_ids
+from image_mirror import mirror_images
+import http_cache
+from item_extractor import get_extractor, extract_categories, clean_text, resolve_extractor
+from parse_pool import run_in_pool, shutdown_pool
+
+MAX_CONCURRENT_REQUESTS = PARSER_ITEM_WORKERS
 FETCH_DELAY_RANGE = (0.01, 0.02)
 SCROLL_PAUSE_TIME = 0
 MAX_SCROLLS = 20
+PARSER_LOCK_ID = 727001
 parsing_restaurants = set()
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 
+class HostRateLimiter:
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next_slot = {}
+
+    async def wait(self, url: str):
+        if not self.interval:
+            return
+        host = urlparse(url).netloc
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot.get(host, now))
+        self._next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
 
-def clean_text(text: str) -> str:
-    if not text:
-        return ""
-    text = text.replace("\xa0", " ")
-    text = re.sub(r"\s+", " ", text)
-    return text.strip()
 
+rate_limiter = HostRateLimiter(PARSER_HOST_RATE_LIMIT)
 
-def parse_price(raw_price: str) -> str:
-    raw_price = clean_text(raw_price)
-    raw_price = re.sub(r"\s*₽", " ₽", raw_price)
-    return raw_price
 
 
 def parse_calories(cal_str: str) -> int:
@@ -44,6 +60,34 @@ def parse_calories(cal_str: str) -> int:
         match = re.search(r"\d+", cal_str)
         return int(match.group(0)) if match else 0
 
+def parse_decimal(raw: str):
+    # "1 250 ₽" -> 1250, "12,5 г" -> 12.5; строки без числа ("Нет данных") -> None
+    raw = re.sub(r"(?<=\d) (?=\d)", "", clean_text(raw))
+    match = re.search(r"\d+(?:[.,]\d+)?", raw)
+    return Decimal(match.group(0).replace(",", ".")) if match else None
+
+def parse_price_kopecks(raw_price: str):
+    value = parse_decimal(raw_price)
+    return int((value * 100).quantize(Decimal(1))) if value is not None else None
+
+# Единица веса/объёма -> (базовая единица, множитель)
+WEIGHT_UNITS = {
+    "г": ("g", 1), "гр": ("g", 1), "кг": ("g", 1000), "g": ("g", 1), "kg": ("g", 1000),
+    "мл": ("ml", 1), "л": ("ml", 1000), "ml": ("ml", 1), "l": ("ml", 1000),
+}
+WEIGHT_UNIT_RE = re.compile(r"(?<![а-яa-z])(" + "|".join(sorted(WEIGHT_UNITS, key=len, reverse=True)) + r")(?![а-яa-z])")
+
+def parse_weight(raw_weight: str):
+    # "0,75 л" -> (750, "ml"), "1 кг" -> (1000, "g"), "250/30 г" -> (250, "g"); без единицы — (число, None)
+    value = parse_decimal(raw_weight)
+    if value is None:
+        return None, None
+    match = WEIGHT_UNIT_RE.search(clean_text(raw_weight).lower())
+    if not match:
+        return value, None
+    unit, factor = WEIGHT_UNITS[match.group(1)]
+    return value * factor, unit
+
 async def scroll_to_bottom(page, pause_time: float = SCROLL_PAUSE_TIME, max_scrolls: int = MAX_SCROLLS):
     last_height = await page.evaluate("document.body.scrollHeight")
     scrolls = 0
@@ -67,43 +111,31 @@ async def get_categories_and_items(page, url: str) -> dict:
     await scroll_to_bottom(page)
 
     content = await page.content()
-    soup = BeautifulSoup(content, "html.parser")
-    categories = {}
+    return await run_in_pool(extract_categories, content)
+
+
+NOT_MODIFIED = object()
 
-    # Проходим по всем блокам категории
-    for cat_container in soup.select(".deliveryCategoryBlockWrapper.deliveryCategoryContainer"):
-        cat_title = cat_container.get("data-title", "Неизвестная категория").strip()
-        # Извлекаем data-id и преобразуем его в целое число
-        try:
-            cat_id = int(cat_container.get("data-id", 0))
-        except ValueError:
-            cat_id = 0
-
-        dish_links = []
-        for a in cat_container.find_all("a", href=True):
-            href = a["href"]
-            if "/menu/" in href:
-                if not href.startswith("http"):
-                    href = BASE_URL + href
-                dish_links.append(href)
-        dish_links = list(set(dish_links))
-        if dish_links:
-            # Сохраняем информацию по категории: ссылки и id
-            categories[cat_title] = {
-                "id": cat_id,
-                "urls": dish_links
-            }
-    return categories
-
-
-async def fetch(url, session, retries=3, delay_range=FETCH_DELAY_RANGE):
 
+async def fetch(url, session, retries=3, delay_range=FETCH_DELAY_RANGE, cache_entry=None):
+    # cache_entry: запись HTTP-кэша; по ней шлём условный запрос и в неё же пишем новые ETag/Last-Modified
+    headers = http_cache.conditional_headers(cache_entry)
     for attempt in range(retries):
         try:
             delay = random.uniform(*delay_range)
             await asyncio.sleep(delay)
-            async with session.get(url, timeout=10) as response:
+            await rate_limiter.wait(url)
+            async with session.get(url, timeout=10, headers=headers) as response:
+                if response.status == 304:
+                    if headers:
+                        return NOT_MODIFIED
+                    # 304 на безусловный запрос: страницы нет ни в ответе, ни в кэше, повтор не поможет
+                    logging.error(f"304 без условного запроса для {url}")
+                    return None
                 if response.status == 200:
+                    if cache_entry is not None:
+                        cache_entry["etag"] = response.headers.get("ETag")
+                        cache_entry["last_modified"] = response.headers.get("Last-Modified")
                     return await response.text()
                 else:
                     logging.error(f"Ошибка {response.status} при запросе {url}")
@@ -122,111 +154,74 @@ def get_restaurant_id_for_item(item_url: str, restaurant_links: dict):
 
 async def parse_item(url, session, category, cat_id, semaphore, restaurant_id):
     async with semaphore:
-        html = await fetch(url, session)
+        entry = await http_cache.load_entry(url)
+        # Результат другого парсера из кэша не берём: после смены ITEM_EXTRACTOR страница разбирается заново
+        extractor = resolve_extractor()
+        cached_item = entry.get("item") if entry.get("extractor") == extractor else None
+        new_entry = dict(entry)
+        if not cached_item:
+            # Без годного результата 304 бесполезен — просим страницу целиком
+            new_entry.pop("etag", None)
+            new_entry.pop("last_modified", None)
+        html = await fetch(url, session, cache_entry=new_entry)
         if html is None:
             logging.error(f"Не удалось получить данные со страницы {url}")
             return None
         try:
-            soup = BeautifulSoup(html, "html.parser")
-
-            item_id = None
-            script_tag = soup.find("script", type="application/ld+json")
-            if script_tag:
-                try:
-                    data = json.loads(script_tag.string)
-                    if isinstance(data, dict) and data.get("@type") == "Product":
-                        item_id = int(data.get("sku"))
-                except Exception as E:
-                    logging.warning(f"Ошибка парсинга JSON-LD для SKU на {url}: {E}")
-
-            name_tag = soup.find("h1", class_="itemTitle")
-            name = clean_text(name_tag.text) if name_tag else "Нет названия"
-
-            description_tag = soup.find("div", class_="itemDesc")
-            description = clean_text(description_tag.text) if description_tag else "Нет описания"
-
-            price_tag = soup.find("div", class_="itemPrice")
-            if price_tag:
-                raw_price = price_tag.get_text(strip=True)
-                price = parse_price(raw_price)
+            # 304 или тот же HTML, что и в прошлый раз — разбор страницы не нужен.
+            # Условный запрос уходит только при годном cached_item, поэтому 304 без него не бывает
+            if html is NOT_MODIFIED:
+                extracted = cached_item
+            elif cached_item and entry.get("body_hash") == http_cache.body_hash(html):
+                extracted = cached_item
+                if (new_entry.get("etag"), new_entry.get("last_modified")) != (entry.get("etag"), entry.get("last_modified")):
+                    await http_cache.save_entry(url, new_entry)
             else:
-                price = "Нет цены"
-
-            nutrition_values = {}
-            nutrition_section = soup.find("div", class_="itemAboutValueContent")
-            if nutrition_section:
-                for stat in nutrition_section.find_all("div", class_="itemStat"):
-                    key_tag = stat.find("span")
-                    if key_tag:
-                        key = clean_text(key_tag.text)
-                        value = clean_text(stat.text.replace(key, ""))
-                        nutrition_values[key] = value
-
-            composition = "Нет состава"
-            composition_section = soup.find("div", class_="itemAboutCompositionContent")
-            if composition_section:
-                composition_p = composition_section.find("p")
-                if composition_p:
-                    composition = clean_text(composition_p.text)
-
-            allergens_section = soup.find("p", style="font-style: italic")
-            allergens = clean_text(allergens_section.text) if allergens_section else "Аллергены: отсутствуют"
-
-            img_url = "Нет фото"
-            item_image_div = soup.find("div", id="itemImage")
-            if item_image_div:
-                img_tag = item_image_div.find("img", itemprop="contentUrl")
-                if img_tag and img_tag.has_attr("src"):
-                    img_url = img_tag["src"]
-            if img_url == "Нет фото":
-                slider = soup.find("div", id="itemSlider")
-                if slider:
-                    first_slide = slider.find("div", class_="itemSlide")
-                    if first_slide:
-                        img_tag = first_slide.find("img", itemprop="contentUrl")
-                        if img_tag and img_tag.has_attr("src"):
-                            img_url = img_tag["src"]
-
-            if img_url != "Нет фото":
-                if img_url.lower().endswith(".svg"):
-                    img_url = "Нет фото"
-                elif not img_url.startswith("http"):
-                    img_url = BASE_URL + img_url
-
-            processed_img = img_url
-            time_label = soup.find("div", class_="timeLabel")
-            timetable = time_label.get_text(strip=True) if time_label else ""
-
-            item = {
-                "SKU": item_id,
-                "Категория": category,
-                "category_id": cat_id,  # добавляем идентификатор категории
-                "Название": name,
-                "Цена": price,
-                "Описание": description,
-                "Пищевая ценность": nutrition_values,
-                "Состав": composition,
-                "Аллергены": allergens,
-                "Фото": processed_img,
-                "В наличии": True,
-                "TimeTable": timetable,
-                "restaurant_id": restaurant_id
-            }
+                extracted = await run_in_pool(get_extractor(extractor), html, url)
+                new_entry["body_hash"] = http_cache.body_hash(html)
+                new_entry["item"] = extracted
+                new_entry["extractor"] = extractor
+                await http_cache.save_entry(url, new_entry)
+
+            item = dict(extracted)
+            item["Категория"] = category
+            item["category_id"] = cat_id  # добавляем идентификатор категории
+            item["restaurant_id"] = restaurant_id
             return item
         except Exception as E:
             logging.exception(f"Ошибка при разборе страницы {url}: {E}")
             return None
 
 
-async def save_items_to_db(db_pool, items: list, table_name: str):
+def item_content_hash(params: tuple) -> str:
+    # Хэш считается по всем колонкам, кроме ключа (id, restaurant_id)
+    payload = json.dumps(params[2:], ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def refresh_categories(conn, table_name: str, restaurant_ids: list, is_wine: bool):
+    # Индекс категорий пересобирается только для ресторанов, которые сейчас синхронизировались
+    await conn.execute(
+        "DELETE FROM categories WHERE restaurant_id = ANY($1) AND is_wine = $2",
+        restaurant_ids, is_wine
+    )
+    await conn.execute(
+        CATEGORIES_INDEX_QUERY.format(is_wine="$2", table=table_name, condition="restaurant_id = ANY($1)"),
+        restaurant_ids, is_wine
+    )
+
+
+async def save_items_to_db(db_pool, items: list, table_name: str, retire_missing: bool = True) -> dict:
+    report = {"inserted": 0, "updated": 0, "unchanged": 0, "retired": 0}
     if not items:
-        return
+        return report
 
     query = f"""
         INSERT INTO {table_name}
             (id, restaurant_id, category, category_id, name, price, calories, proteins, fats, carbohydrates, weight,
-             description, composition, allergens, image, availability, timetable)
-        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15, $16, $17)
+             description, composition, allergens, image, availability, timetable,
+             price_kopecks, proteins_value, fats_value, carbohydrates_value, weight_value, weight_unit, content_hash)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15, $16, $17, $18, $19, $20, $21, $22, $23, $24)
         ON CONFLICT (id, restaurant_id) DO UPDATE
         SET category = EXCLUDED.category,
             category_id = EXCLUDED.category_id,
@@ -242,9 +237,16 @@ async def save_items_to_db(db_pool, items: list, table_name: str):
             allergens = EXCLUDED.allergens,
             image = EXCLUDED.image,
             availability = EXCLUDED.availability,
-            timetable = EXCLUDED.timetable;
+            timetable = EXCLUDED.timetable,
+            price_kopecks = EXCLUDED.price_kopecks,
+            proteins_value = EXCLUDED.proteins_value,
+            fats_value = EXCLUDED.fats_value,
+            carbohydrates_value = EXCLUDED.carbohydrates_value,
+            weight_value = EXCLUDED.weight_value,
+            weight_unit = EXCLUDED.weight_unit,
+            content_hash = EXCLUDED.content_hash;
     """
-    params_list = []
+    params_list = {}
     for item in items:
         sku = item.get("SKU")
         if not sku:
@@ -271,7 +273,7 @@ async def save_items_to_db(db_pool, items: list, table_name: str):
         carbs = nutrition.get("Углеводы", "Нет данных")
         weight = nutrition.get("Вес", "Нет данных")
         timetable = item.get("TimeTable", "")
-        params_list.append((
+        params = (
             sku,
             rest_id,
             category,
@@ -288,20 +290,217 @@ async def save_items_to_db(db_pool, items: list, table_name: str):
             allergens,
             img_url,
             availability,
-            timetable
-        ))
+            timetable,
+            # Числовые значения считаются один раз при загрузке, а не при каждом обращении бота
+            parse_price_kopecks(price),
+            parse_decimal(proteins),
+            parse_decimal(fats),
+            parse_decimal(carbs),
+            *parse_weight(weight)
+        )
+        # Одна и та же позиция может встретиться в нескольких категориях. Порядок обхода от прогона
+        # к прогону разный, поэтому оставляем копию с наименьшим category_id — иначе хэш бы «прыгал»
+        key = (sku, rest_id)
+        if key in params_list and params_list[key][3] <= category_id:
+            continue
+        params_list[key] = params + (item_content_hash(params),)
+
+    restaurant_ids = list({rest_id for _, rest_id in params_list})
     async with db_pool.acquire() as conn:
-        await conn.executemany(query, params_list)
+        async with conn.transaction():
+            stored_rows = await conn.fetch(
+                f"SELECT id, restaurant_id, content_hash, availability, image FROM {table_name} WHERE restaurant_id = ANY($1)",
+                restaurant_ids
+            )
+            stored = {(r["id"], r["restaurant_id"]): r for r in stored_rows}
+
+            changed = []
+            replaced_images = set()
+            for key, params in params_list.items():
+                row = stored.get(key)
+                if row is None:
+                    report["inserted"] += 1
+                    changed.append(params)
+                elif row["content_hash"] != params[-1] or not row["availability"]:
+                    report["updated"] += 1
+                    changed.append(params)
+                    if row["image"] and row["image"] != params[14]:
+                        replaced_images.add(row["image"])
+                else:
+                    report["unchanged"] += 1
+            if changed:
+                await conn.executemany(query, changed)
+            # Старая картинка позиции заменена — её file_id в Telegram больше не нужен
+            await forget_file_ids(conn, list(replaced_images))
+
+            if retire_missing:
+                retired = {}
+                for key, row in stored.items():
+                    if key not in params_list and row["availability"]:
+                        retired.setdefault(key[1], []).append(key[0])
+                for rest_id, ids in retired.items():
+                    await conn.execute(
+                        f"UPDATE {table_name} SET availability = FALSE WHERE restaurant_id = $1 AND id = ANY($2)",
+                        rest_id, ids
+                    )
+                    report["retired"] += len(ids)
+
+            is_wine = table_name == "vine_card"
+            changed_catalog = report["inserted"] or report["updated"] or report["retired"]
+            if changed_catalog or not await conn.fetchval(
+                "SELECT EXISTS (SELECT 1 FROM categories WHERE restaurant_id = ANY($1) AND is_wine = $2)",
+                restaurant_ids, is_wine
+            ):
+                await refresh_categories(conn, table_name, restaurant_ids, is_wine)
+
+            if changed_catalog:
+                for rest_id in restaurant_ids:
+                    await notify_catalog_changed(conn, rest_id)
+
+    if report["inserted"] or report["updated"] or report["retired"]:
+        for rest_id in restaurant_ids:
+            invalidate_restaurant(rest_id)
+    logging.info(
+        f"{table_name}: добавлено {report['inserted']}, обновлено {report['updated']}, "
+        f"без изменений {report['unchanged']}, снято с продажи {report['retired']}"
+    )
+    return report
+
+
+class RestaurantSync:
+    def __init__(self, db_pool, restaurant_links: dict):
+        self.db_pool = db_pool
+        self.page_queue = asyncio.Queue()
+        self.item_queue = asyncio.Queue()
+        # Ресторан сохраняется, когда по нему не осталось ни страниц категорий, ни позиций
+        self.pending = {}
+        self.items = {}
+        # Если часть страниц не загрузилась, пропавшие позиции не снимаем с продажи
+        self.failed = set()
+        for restaurant_id, links in restaurant_links.items():
+            menu_url = links.get("restaurant_menu")
+            wine_url = links.get("wine_card") or links.get("vine_url", "")
+            self.pending[restaurant_id] = 0
+            self.items[restaurant_id] = {"menu": [], "vine_card": []}
+            if menu_url:
+                self.add_page(restaurant_id, "menu", menu_url)
+            else:
+                logging.warning(f"У ресторана {restaurant_id} нет ссылки на меню.")
+            if wine_url:
+                self.add_page(restaurant_id, "vine_card", wine_url)
+            else:
+                logging.warning(f"У ресторана {restaurant_id} нет ссылки на винную карту.")
+            if self.pending[restaurant_id]:
+                parsing_restaurants.add(restaurant_id)
 
+    def add_page(self, restaurant_id, table_name, url):
+        self.pending[restaurant_id] += 1
+        self.page_queue.put_nowait((restaurant_id, table_name, url))
 
-async def main():
-    db_pool = await asyncpg.create_pool(**DB_CONFIG, min_size=1, max_size=10)
+    def add_item(self, restaurant_id, table_name, category, cat_id, url):
+        self.pending[restaurant_id] += 1
+        self.item_queue.put_nowait((restaurant_id, table_name, category, cat_id, url))
+
+    async def done(self, restaurant_id):
+        self.pending[restaurant_id] -= 1
+        if self.pending[restaurant_id] == 0:
+            await self.save_restaurant(restaurant_id)
+
+    async def save_restaurant(self, restaurant_id):
+        try:
+            menu_items = self.items[restaurant_id]["menu"]
+            wine_items = self.items[restaurant_id]["vine_card"]
+            if menu_items:
+                await save_items_to_db(self.db_pool, menu_items, "menu",
+                                       retire_missing=(restaurant_id, "menu") not in self.failed)
+                logging.info(f"Синхронизация меню завершена для ресторана {restaurant_id}.")
+            else:
+                logging.info(f"Для ресторана {restaurant_id} меню не найдено или пустое.")
+
+            if wine_items:
+                await save_items_to_db(self.db_pool, wine_items, "vine_card",
+                                       retire_missing=(restaurant_id, "vine_card") not in self.failed)
+                logging.info(f"Синхронизация винной карты завершена для ресторана {restaurant_id}.")
+            else:
+                logging.info(f"Для ресторана {restaurant_id} винная карта не найдена или пустая.")
+        except Exception as e:
+            logging.exception(f"Ошибка при сохранении ресторана {restaurant_id}: {e}")
+        finally:
+            parsing_restaurants.discard(restaurant_id)
+            del self.items[restaurant_id]
+
+    async def page_worker(self, context):
+        page = None
+        try:
+            while True:
+                restaurant_id, table_name, url = await self.page_queue.get()
+                try:
+                    # Вкладка создаётся под обработкой ошибок: сбой Chromium помечает страницу
+                    # неудачной, а воркер продолжает разбирать очередь
+                    if page is None or page.is_closed():
+                        page = await context.new_page()
+                    logging.info(f"Ресторан {restaurant_id}, {table_name}: {url}")
+                    await rate_limiter.wait(url)
+                    categories_dict = await get_categories_and_items(page, url)
+                    for category, details in categories_dict.items():
+                        for item_url in details["urls"]:
+                            self.add_item(restaurant_id, table_name, category, details["id"], item_url)
+                except Exception as e:
+                    self.failed.add((restaurant_id, table_name))
+                    logging.exception(f"Ошибка при парсинге страницы {url} ресторана {restaurant_id}: {e}")
+                finally:
+                    await self.done(restaurant_id)
+                    self.page_queue.task_done()
+        finally:
+            if page is not None and not page.is_closed():
+                await page.close()
+
+    async def item_worker(self, session, semaphore):
+        while True:
+            restaurant_id, table_name, category, cat_id, url = await self.item_queue.get()
+            try:
+                item = await parse_item(url, session, category, cat_id, semaphore, restaurant_id)
+                if item:
+                    self.items[restaurant_id][table_name].append(item)
+                else:
+                    self.failed.add((restaurant_id, table_name))
+            except Exception as e:
+                self.failed.add((restaurant_id, table_name))
+                logging.exception(f"Ошибка при парсинге позиции {url}: {e}")
+            finally:
+                await self.done(restaurant_id)
+                self.item_queue.task_done()
+
+    async def join_queues(self):
+        # Позиции попадают в очередь только из page_worker, поэтому сначала ждём страницы
+        await self.page_queue.join()
+        await self.item_queue.join()
+
+    async def run(self, context, session, page_workers: int = PARSER_PAGE_WORKERS, item_workers: int = MAX_CONCURRENT_REQUESTS):
+        semaphore = asyncio.Semaphore(item_workers)
+        workers = [asyncio.create_task(self.page_worker(context)) for _ in range(max(1, page_workers))]
+        workers += [asyncio.create_task(self.item_worker(session, semaphore)) for _ in range(max(1, item_workers))]
+        joined = asyncio.create_task(self.join_queues())
+        try:
+            # Воркеры работают бесконечно, поэтому завершившийся воркер — это сбой. Без этой проверки
+            # join() ждал бы вечно, а парсер навсегда держал бы advisory lock
+            done, _ = await asyncio.wait([joined, *workers], return_when=asyncio.FIRST_COMPLETED)
+            if joined not in done:
+                crashed = done.pop()
+                raise RuntimeError("Воркер синхронизации завершился аварийно") from crashed.exception()
+        finally:
+            joined.cancel()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+
+async def main(db_pool):
     restaurant_links = await get_links(db_pool)
     if not restaurant_links:
         logging.warning("Словарь ссылок ресторанов пустой.")
         return
 
-    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
     connector = aiohttp.TCPConnector(ssl=False)
 
     async with async_playwright() as p:
@@ -310,87 +509,60 @@ async def main():
         context = await browser.new_context()
 
         async with aiohttp.ClientSession(connector=connector) as session:
-            for restaurant_id, links in restaurant_links.items():
-                try:
-                    parsing_restaurants.add(restaurant_id)
-
-                    menu_url = links.get("restaurant_menu")
-                    wine_url = links.get("wine_card") or links.get("vine_url", "")
-
-                    restaurant_menu_items = []
-                    restaurant_wine_items = []
-
-                    if menu_url:
-                        logging.info(f"Переходим по меню ресторана {restaurant_id}: {menu_url}")
-                        page = await context.new_page()
-                        categories_dict = await get_categories_and_items(page, menu_url)
-                        await page.close()
-
-                        tasks = []
-                        for category, details in categories_dict.items():
-                            cat_id = details["id"]  # извлекаем category_id из details
-                            for url in details["urls"]:
-                                # Передаём category, cat_id, semaphore и restaurant_id
-                                tasks.append(parse_item(url, session, category, cat_id, semaphore, restaurant_id))
-                        results = await asyncio.gather(*tasks)
-                        for item in results:
-                            if item:
-                                restaurant_menu_items.append(item)
-                    else:
-                        logging.warning(f"У ресторана {restaurant_id} нет ссылки на меню.")
-
-                    if wine_url:
-                        logging.info(f"Переходим по винной карте ресторана {restaurant_id}: {wine_url}")
-                        page = await context.new_page()
-                        wine_categories_dict = await get_categories_and_items(page, wine_url)
-                        await page.close()
-
-                        tasks = []
-                        for category, details in wine_categories_dict.items():
-                            cat_id = details["id"]
-                            for url in details["urls"]:
-                                tasks.append(parse_item(url, session, category, cat_id, semaphore, restaurant_id))
-                        results = await asyncio.gather(*tasks)
-                        for item in results:
-                            if item:
-                                restaurant_wine_items.append(item)
-                    else:
-                        logging.warning(f"У ресторана {restaurant_id} нет ссылки на винную карту.")
-
-                    if restaurant_menu_items:
-                        await save_items_to_db(db_pool, restaurant_menu_items, "menu")
-                        logging.info(f"Синхронизация меню завершена для ресторана {restaurant_id}.")
-                    else:
-                        logging.info(f"Для ресторана {restaurant_id} меню не найдено или пустое.")
-
-                    if restaurant_wine_items:
-                        await save_items_to_db(db_pool, restaurant_wine_items, "vine_card")
-                        logging.info(f"Синхронизация винной карты завершена для ресторана {restaurant_id}.")
-                    else:
-                        logging.info(f"Для ресторана {restaurant_id} винная карта не найдена или пустая.")
-
-                except Exception as e:
-                    logging.exception(f"Ошибка при парсинге ресторана {restaurant_id}: {e}")
-                finally:
-                    if restaurant_id in parsing_restaurants:
-                        parsing_restaurants.remove(restaurant_id)
+            sync = RestaurantSync(db_pool, restaurant_links)
+            await sync.run(context, session)
+            await mirror_images(db_pool, session, rate_limiter)
 
         await browser.close()
-    await db_pool.close()
     logging.info("Синхронизация с сайтом завершена. Все позиции обновлены в базе данных.")
 
-async def periodic_parser():
-    while True:
+async def run_exclusive(db_pool) -> bool:
+    # Advisory lock держится на выделенном соединении пула; при его возврате в пул asyncpg снимает все блокировки
+    async with db_pool.acquire() as conn:
+        if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", PARSER_LOCK_ID):
+            logging.info("Парсер уже запущен другим процессом, пропускаем запуск.")
+            return False
         try:
-            logging.info("Запуск периодического парсера...")
-            await main()
-            logging.info("Периодический парсер завершил работу, ожидаем час до следующего запуска.")
-        except Exception as e:
-            logging.exception(f"Ошибка в периодическом парсере: {e}")
-        await asyncio.sleep(3600)
+            await main(db_pool)
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", PARSER_LOCK_ID)
+        return True
+
+async def create_parser_pool():
+    return await create_pool("parser", PARSER_DB_POOL_MIN_SIZE, PARSER_DB_POOL_MAX_SIZE)
+
+async def periodic_parser(db_pool=None):
+    # Пул живёт между запусками: соединения и подготовленные запросы переиспользуются
+    if db_pool is None:
+        db_pool = await create_parser_pool()
+    try:
+        while True:
+            try:
+                logging.info("Запуск периодического парсера...")
+                await run_exclusive(db_pool)
+                db_pool.log_stats()
+                logging.info("Периодический парсер завершил работу, ожидаем час до следующего запуска.")
+            except Exception as e:
+                logging.exception(f"Ошибка в периодическом парсере: {e}")
+            await asyncio.sleep(3600)
+    finally:
+        shutdown_pool()
+
+async def run_once():
+    db_pool = await create_parser_pool()
+    try:
+        await run_exclusive(db_pool)
+        db_pool.log_stats()
+    finally:
+        shutdown_pool()
+        await db_pool.close()
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        # python parser.py --periodic — отдельный сервис парсера, без аргументов — один проход
+        if "--periodic" in sys.argv:
+            asyncio.run(periodic_parser())
+        else:
+            asyncio.run(run_once())
     except Exception as e:
-        logging.exception(f"Ошибка: {e}")
\ No newline at end of file
+        logging.exception(f"Ошибка: {e}")
@@ -0,0 +1,36 @@
+import logging
+from catalog_cache import CatalogCache, image_caches
+
+logger = logging.getLogger(__name__)
+
+# URL картинки -> file_id, который Telegram вернул при первой отправке
+file_id_cache = CatalogCache(ttl=24 * 3600)
+image_caches.append(file_id_cache)
+
+
+async def get_file_id(db_pool, image_url: str):
+    file_id = file_id_cache.get(image_url)
+    if file_id is not None:
+        return file_id
+    async with db_pool.acquire() as conn:
+        file_id = await conn.fetchval("SELECT file_id FROM telegram_files WHERE image_url = $1", image_url)
+    if file_id:
+        file_id_cache.set(image_url, file_id)
+    return file_id
+
+
+async def remember_file_id(db_pool, image_url: str, file_id: str):
+    file_id_cache.set(image_url, file_id)
+    async with db_pool.acquire() as conn:
+        await conn.execute("""
+            INSERT INTO telegram_files (image_url, file_id)
+            VALUES ($1, $2)
+            ON CONFLICT (image_url) DO UPDATE SET file_id = EXCLUDED.file_id, updated_at = now()
+        """, image_url, file_id)
+
+
+async def forget_file_ids(conn, image_urls: list):
+    for image_url in image_urls:
+        file_id_cache.discard(image_url)
+    if image_urls:
+        await conn.execute("DELETE FROM telegram_files WHERE image_url = ANY($1)", image_urls)
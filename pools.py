@@ -0,0 +1,72 @@
+import time
+import logging
+import asyncpg
+from config1 import DB_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class AcquireStats:
+    def __init__(self):
+        self.count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float):
+        self.count += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def snapshot(self) -> dict:
+        avg_wait = self.total_wait / self.count if self.count else 0.0
+        return {"count": self.count, "avg_ms": avg_wait * 1000, "max_ms": self.max_wait * 1000}
+
+    def reset(self):
+        self.count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class _TimedAcquire:
+    def __init__(self, pool):
+        self._pool = pool
+        self._ctx = None
+
+    async def __aenter__(self):
+        started = time.perf_counter()
+        self._ctx = self._pool.pool.acquire()
+        conn = await self._ctx.__aenter__()
+        self._pool.stats.record(time.perf_counter() - started)
+        return conn
+
+    async def __aexit__(self, *exc):
+        return await self._ctx.__aexit__(*exc)
+
+
+class TimedPool:
+    # Обёртка над asyncpg.Pool, которая считает время ожидания свободного соединения
+    def __init__(self, pool, name: str):
+        self.pool = pool
+        self.name = name
+        self.stats = AcquireStats()
+
+    def acquire(self):
+        return _TimedAcquire(self)
+
+    def log_stats(self, reset: bool = True):
+        stats = self.stats.snapshot()
+        logger.info(
+            f"Пул {self.name}: {stats['count']} acquire, ожидание в среднем {stats['avg_ms']:.1f} мс, "
+            f"максимум {stats['max_ms']:.1f} мс (размер {self.pool.get_size()}, "
+            f"min={self.pool.get_min_size()}, max={self.pool.get_max_size()})"
+        )
+        if reset:
+            self.stats.reset()
+
+    async def close(self):
+        await self.pool.close()
+
+
+async def create_pool(name: str, min_size: int, max_size: int) -> TimedPool:
+    pool = await asyncpg.create_pool(**DB_CONFIG, min_size=min_size, max_size=max_size)
+    return TimedPool(pool, name)
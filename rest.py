@@ -10,6 +10,8 @@ from bs4 import BeautifulSoup
 import asyncio
 import random
 from config1 import DB_CONFIG
+from catalog_cache import bump_catalog_version, notify_catalog_changed
+from parse_pool import run_in_pool
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
@@ -31,58 +33,62 @@ async def fetch_with_delay(url, session, semaphore):
             response.raise_for_status()
             return await response.text()
 
+def extract_restaurant_data(page_text: str) -> dict:
+    soup = BeautifulSoup(page_text, "html.parser")
+
+    script_tag = soup.find('script', id='__NEXT_DATA__')
+    json_data = script_tag.string
+    dat = json.loads(json_data)
+    restaurant_id = dat['props']['pageProps']['restaurant']['inner-id']
+    title = dat['props']['pageProps']['restaurant']['title']
+    descriptions = soup.find("div", class_="styles__AboutContent-sc-1q087s8-26 kcNVuQ")
+    description_text = descriptions.get_text(strip=True) if descriptions else "Нет описания"
+
+    extra_info = soup.find_all("div", class_="styles__ExtraInfoItemText-sc-1q087s8-23 KvPwL")
+    veranda = extra_info[0].get_text(strip=True) if len(extra_info) > 0 else "Без летней веранды"
+    changing_table = dat['props']['pageProps']['restaurant']['changing-tables']
+    animation = extra_info[2].get_text(strip=True) if len(extra_info) > 2 else "Без детской анимации"
+
+    address = dat['props']['pageProps']['restaurant']['address']
+
+    vine = soup.find("a", class_='underline', attrs={"rel": "noopener noreferrer"})
+    vine_text = vine.get_text(strip=True) if vine else ""
+    vine_url = vine['href'] if vine else ""
+
+    restaurant_img = soup.find('img', {'itemprop': 'contentUrl'})
+    img_url = restaurant_img["src"]
+
+    metro = dat['props']['pageProps']['restaurant']['metro']
+    work_time = str(dat['props']['pageProps']['restaurant']['working-hours']).replace("[", "").replace("]", "")
+    contacts = dat['props']['pageProps']['restaurant']['phone']
+    contacts = normalize_phone_number(contacts)
+
+    restaurant_menu = soup.find("a", string="Смотреть меню")
+    menu_url = restaurant_menu['href'] if restaurant_menu else "Нет меню"
+
+    data = {
+        "id": restaurant_id,
+        # Имя ресторана будет добавлено отдельно при сборе общего списка
+        "address": address,
+        "restaurant_img": img_url,
+        "metro": metro,
+        "description": description_text,
+        "veranda": veranda,
+        "changing_table": changing_table,
+        "animation": animation,
+        "work_time": work_time,
+        "contacts": contacts,
+        "vine": vine_text,
+        "vine_url": vine_url,
+        "restaurant_menu": menu_url,
+    }
+    return data
+
+
 async def fetch_restaurant_data(url, session, semaphore):
     try:
         page_text = await fetch_with_delay(url, session, semaphore)
-        soup = BeautifulSoup(page_text, "html.parser")
-
-        script_tag = soup.find('script', id='__NEXT_DATA__')
-        json_data = script_tag.string
-        dat = json.loads(json_data)
-        restaurant_id = dat['props']['pageProps']['restaurant']['inner-id']
-        title = dat['props']['pageProps']['restaurant']['title']
-        descriptions = soup.find("div", class_="styles__AboutContent-sc-1q087s8-26 kcNVuQ")
-        description_text = descriptions.get_text(strip=True) if descriptions else "Нет описания"
-
-        extra_info = soup.find_all("div", class_="styles__ExtraInfoItemText-sc-1q087s8-23 KvPwL")
-        veranda = extra_info[0].get_text(strip=True) if len(extra_info) > 0 else "Без летней веранды"
-        changing_table = dat['props']['pageProps']['restaurant']['changing-tables']
-        animation = extra_info[2].get_text(strip=True) if len(extra_info) > 2 else "Без детской анимации"
-
-        address = dat['props']['pageProps']['restaurant']['address']
-
-        vine = soup.find("a", class_='underline', attrs={"rel": "noopener noreferrer"})
-        vine_text = vine.get_text(strip=True) if vine else ""
-        vine_url = vine['href'] if vine else ""
-
-        restaurant_img = soup.find('img', {'itemprop': 'contentUrl'})
-        img_url = restaurant_img["src"]
-
-        metro = dat['props']['pageProps']['restaurant']['metro']
-        work_time = str(dat['props']['pageProps']['restaurant']['working-hours']).replace("[", "").replace("]", "")
-        contacts = dat['props']['pageProps']['restaurant']['phone']
-        contacts = normalize_phone_number(contacts)
-
-        restaurant_menu = soup.find("a", string="Смотреть меню")
-        menu_url = restaurant_menu['href'] if restaurant_menu else "Нет меню"
-
-        data = {
-            "id": restaurant_id,
-            # Имя ресторана будет добавлено отдельно при сборе общего списка
-            "address": address,
-            "restaurant_img": img_url,
-            "metro": metro,
-            "description": description_text,
-            "veranda": veranda,
-            "changing_table": changing_table,
-            "animation": animation,
-            "work_time": work_time,
-            "contacts": contacts,
-            "vine": vine_text,
-            "vine_url": vine_url,
-            "restaurant_menu": menu_url,
-        }
-        return data
+        return await run_in_pool(extract_restaurant_data, page_text)
 
     except requests.RequestException as e:
         logging.error(f"Ошибка при запросе {url}: {e}")
@@ -101,8 +107,9 @@ async def fetch_all_restaurants(session, semaphore):
     return restaurants
 
 async def save_restaurants_to_db(db_pool, restaurants: list):
+    # Возвращает ссылки на меню и число ресторанов, строки которых действительно изменились
     if not restaurants:
-        return {}
+        return {}, 0
 
     query = """
         INSERT INTO restaurants 
@@ -119,7 +126,15 @@ async def save_restaurants_to_db(db_pool, restaurants: list):
             animation = EXCLUDED.animation,
             work_time = EXCLUDED.work_time,
             contacts = EXCLUDED.contacts,
-            vine_card = EXCLUDED.vine_card;
+            vine_card = EXCLUDED.vine_card
+        WHERE (restaurants.name, restaurants.address, restaurants.image, restaurants.metro, restaurants.description,
+               restaurants.veranda, restaurants.changing_table, restaurants.animation, restaurants.work_time,
+               restaurants.contacts, restaurants.vine_card)
+              IS DISTINCT FROM
+              (EXCLUDED.name, EXCLUDED.address, EXCLUDED.image, EXCLUDED.metro, EXCLUDED.description,
+               EXCLUDED.veranda, EXCLUDED.changing_table, EXCLUDED.animation, EXCLUDED.work_time,
+               EXCLUDED.contacts, EXCLUDED.vine_card)
+        RETURNING restaurant_id;
     """
 
     params_list = []
@@ -165,23 +180,58 @@ async def save_restaurants_to_db(db_pool, restaurants: list):
             "wine_card": wine_card_link
         }
 
+    changed = 0
     async with db_pool.acquire() as conn:
-        await conn.executemany(query, params_list)
+        async with conn.transaction():
+            for params in params_list:
+                # Неизменённая строка не обновляется и ничего не возвращает
+                if await conn.fetchval(query, *params) is not None:
+                    changed += 1
 
-    return links_dict
+    return links_dict, changed
 
-async def main(db_pool):
-    restaurant_data_list = []
+async def collect_restaurants(db_pool):
     semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
     connector = aiohttp.TCPConnector(ssl=False)
+    restaurant_data_list = []
+    links = {}
+    changed = 0
     async with aiohttp.ClientSession(connector=connector) as session:
         restaurants_dict = await fetch_all_restaurants(session, semaphore)
-        for name, url in restaurants_dict.items():
+
+        async def fetch_named(name, url):
             data = await fetch_restaurant_data(url, session, semaphore)
             if data:
                 data["name"] = name
-                restaurant_data_list.append(data)
-                logging.info(f"Получены данные ресторана: {name}")
+            return name, data
+
+        # Страницы ресторанов качаются параллельно (не больше MAX_CONCURRENT_REQUESTS),
+        # каждая сохраняется в базу сразу, как только готова
+        tasks = [fetch_named(name, url) for name, url in restaurants_dict.items()]
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                name, data = await next_done
+            except Exception as e:
+                logging.exception(f"Ошибка при получении данных ресторана: {e}")
+                continue
+            if not data:
+                continue
+            restaurant_data_list.append(data)
+            logging.info(f"Получены данные ресторана: {name}")
+            saved_links, saved_changed = await save_restaurants_to_db(db_pool, [data])
+            links.update(saved_links)
+            changed += saved_changed
+
+    # Клавиатуры пересобираются один раз за синхронизацию и только если рестораны изменились
+    if changed:
+        async with db_pool.acquire() as conn:
+            await notify_catalog_changed(conn)
+        bump_catalog_version()
+    logging.info(f"Ресторанов получено {len(restaurant_data_list)}, изменилось {changed}")
+    return links, restaurant_data_list
+
+async def main(db_pool):
+    links, restaurant_data_list = await collect_restaurants(db_pool)
 
     for restaurant in restaurant_data_list:
         logging.info("-" * 70)
@@ -199,23 +249,12 @@ async def main(db_pool):
         logging.info(f"Меню: {restaurant.get('restaurant_menu')}")
         logging.info(f"Ссылка на винную карту: {restaurant.get('vine_url')}")
 
-    links = await save_restaurants_to_db(db_pool, restaurant_data_list)
     logging.info("Сохраненные ссылки:")
     logging.info(links)
     return links
 
 async def get_links(db_pool):
-    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
-    connector = aiohttp.TCPConnector(ssl=False)
-    restaurant_data_list = []
-    async with aiohttp.ClientSession(connector=connector) as session:
-        restaurants_dict = await fetch_all_restaurants(session, semaphore)
-        for name, url in restaurants_dict.items():
-            data = await fetch_restaurant_data(url, session, semaphore)
-            if data:
-                data["name"] = name
-                restaurant_data_list.append(data)
-    links = await save_restaurants_to_db(db_pool, restaurant_data_list)
+    links, _ = await collect_restaurants(db_pool)
     return links
 
 if __name__ == "__main__":
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import SimpleEventIsolation
+from aiogram.types import TelegramObject
+from config1 import UPDATE_MAX_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateLimitMiddleware(BaseMiddleware):
+    # Единственный лимит одновременно обрабатываемых обновлений — и для polling, и для webhook.
+    # Очередь считается целиком: ожидание своей очереди пользователя (isolation) и свободного слота
+    def __init__(self, max_concurrency: int = UPDATE_MAX_CONCURRENCY):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.isolation = CountingEventIsolation(self)
+        self.waiting_user = 0
+        self.waiting_slot = 0
+        self.active = 0
+        self.max_queued = 0
+
+    @property
+    def queued(self) -> int:
+        return self.waiting_user + self.waiting_slot
+
+    def track_queue(self):
+        self.max_queued = max(self.max_queued, self.queued)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        self.waiting_slot += 1
+        self.track_queue()
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting_slot -= 1
+        self.active += 1
+        try:
+            return await handler(event, data)
+        finally:
+            self.active -= 1
+            self.semaphore.release()
+
+    def log_stats(self, reset: bool = True):
+        logger.info(
+            f"Обновления: выполняется {self.active}, в очереди {self.queued} "
+            f"(ждут предыдущее обновление пользователя {self.waiting_user}, свободный слот {self.waiting_slot}; "
+            f"максимум {self.max_queued})"
+        )
+        if reset:
+            self.max_queued = self.queued
+
+
+class CountingEventIsolation(SimpleEventIsolation):
+    # Обновления одного пользователя идут строго по очереди: диспетчер берёт эту блокировку
+    # до чтения FSM-состояния и до внешних middleware; время ожидания попадает в очередь лимитера
+    def __init__(self, limiter: UpdateLimitMiddleware):
+        super().__init__()
+        self.limiter = limiter
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        lock = self._locks[key]
+        self.limiter.waiting_user += 1
+        self.limiter.track_queue()
+        try:
+            await lock.acquire()
+        finally:
+            self.limiter.waiting_user -= 1
+        try:
+            yield
+        finally:
+            lock.release()
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# Модули проекта лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main.py и clients.py создают Bot при импорте, а он проверяет формат токена
+os.environ.setdefault("BOT_TOKEN", "123456:TEST-TOKEN")
+
+# Отдельная (одноразовая) база для тестов с Postgres: таблицы в ней пересоздаются
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL", "")
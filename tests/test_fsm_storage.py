@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from conftest import TEST_DATABASE_URL
+
+if not TEST_DATABASE_URL:
+    pytest.skip("TEST_DATABASE_URL не задан", allow_module_level=True)
+
+import asyncpg
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+
+import database
+from fsm_storage import PostgresStorage
+
+# Отдельный bot_id, чтобы ключи теста не пересекались с другими данными в базе
+BOT_ID = 777000
+KEY = StorageKey(bot_id=BOT_ID, chat_id=42, user_id=42)
+OTHER_KEY = StorageKey(bot_id=BOT_ID, chat_id=43, user_id=43)
+
+
+class Form(StatesGroup):
+    name = State()
+    age = State()
+
+
+@pytest.fixture(scope="module", autouse=True)
+def schema():
+    asyncio.run(database.migrate(TEST_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)))
+
+
+async def with_pool(scenario):
+    pool = await asyncpg.create_pool(TEST_DATABASE_URL, min_size=1, max_size=2)
+    try:
+        await pool.execute("DELETE FROM fsm_states WHERE key LIKE $1", f"{BOT_ID}:%")
+        return await scenario(pool)
+    finally:
+        await pool.execute("DELETE FROM fsm_states WHERE key LIKE $1", f"{BOT_ID}:%")
+        await pool.close()
+
+
+def test_state_is_shared_between_instances():
+    async def scenario(pool):
+        writer, reader = PostgresStorage(pool), PostgresStorage(pool)
+        await writer.set_state(KEY, Form.name)
+        await writer.set_data(KEY, {"name": "Иван"})
+        assert await reader.get_state(KEY) == Form.name.state
+        assert await reader.get_data(KEY) == {"name": "Иван"}
+
+        # Смена состояния не затирает данные, и наоборот
+        await reader.set_state(KEY, Form.age)
+        await reader.update_data(KEY, {"age": 30})
+        assert await writer.get_state(KEY) == Form.age.state
+        assert await writer.get_data(KEY) == {"name": "Иван", "age": 30}
+        assert await writer.get_state(OTHER_KEY) is None
+
+    asyncio.run(with_pool(scenario))
+
+
+def test_abandoned_state_expires():
+    async def scenario(pool):
+        storage = PostgresStorage(pool, ttl=60)
+        await storage.set_state(KEY, Form.name)
+        await storage.set_data(KEY, {"name": "Иван"})
+        await storage.set_state(OTHER_KEY, Form.name)
+        await pool.execute("UPDATE fsm_states SET updated_at = now() - interval '2 minutes' WHERE key LIKE $1",
+                           f"{BOT_ID}:{KEY.chat_id}:%")
+
+        assert await storage.get_state(KEY) is None
+        assert await storage.get_data(KEY) == {}
+
+        # Новая запись поверх просроченной начинает с пустых данных
+        await storage.set_state(KEY, Form.age)
+        assert await storage.get_data(KEY) == {}
+
+        await pool.execute("UPDATE fsm_states SET updated_at = now() - interval '2 minutes' WHERE key LIKE $1",
+                           f"{BOT_ID}:{KEY.chat_id}:%")
+        await storage.cleanup()
+        keys = {row["key"] for row in await pool.fetch("SELECT key FROM fsm_states WHERE key LIKE $1", f"{BOT_ID}:%")}
+        assert keys == {f"{BOT_ID}:{OTHER_KEY.chat_id}:{OTHER_KEY.user_id}:None:None:default"}
+
+    asyncio.run(with_pool(scenario))
+
+
+def test_state_survives_close():
+    async def scenario(pool):
+        storage = PostgresStorage(pool)
+        storage.set_pool(pool)
+        await storage.set_state(KEY, Form.name)
+        await storage.set_data(KEY, {"name": "Иван"})
+        await storage.close()
+        assert storage._cleanup_task is None
+
+        restarted = PostgresStorage(pool)
+        assert await restarted.get_state(KEY) == Form.name.state
+        assert await restarted.get_data(KEY) == {"name": "Иван"}
+
+    asyncio.run(with_pool(scenario))
+
+
+def test_unserializable_data_does_not_block_other_keys():
+    async def scenario(pool):
+        storage = PostgresStorage(pool)
+        await storage.set_data(KEY, {"name": "Иван"})
+        with pytest.raises(TypeError):
+            await storage.set_data(KEY, {"photo": object()})
+        await storage.set_data(OTHER_KEY, {"name": "Пётр"})
+
+        assert await storage.get_data(KEY) == {"name": "Иван"}
+        assert await storage.get_data(OTHER_KEY) == {"name": "Пётр"}
+
+    asyncio.run(with_pool(scenario))
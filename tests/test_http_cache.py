@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+from aiohttp import web, ClientSession
+from aiohttp.test_utils import TestServer
+
+import parser
+import http_cache
+
+PAGE_PATH = "/menu/syrniki"
+PAGE = """<html><head><script type="application/ld+json">{{"@type": "Product", "sku": "501"}}</script></head>
+<body><h1 class="itemTitle">{name}</h1><div class="itemPrice">480 ₽</div></body></html>"""
+
+
+class DishSite:
+    # Страница блюда с ETag; отвечает 304 на совпавший If-None-Match
+    def __init__(self, name: str = "Сырники", etag: str = '"v1"'):
+        self.name = name
+        self.etag = etag
+        self.send_etag = True
+        self.force_status = None
+        self.requests = []
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests.append(dict(request.headers))
+        if self.force_status:
+            return web.Response(status=self.force_status)
+        if self.send_etag and request.headers.get("If-None-Match") == self.etag:
+            return web.Response(status=304)
+        headers = {"ETag": self.etag} if self.send_etag else {}
+        return web.Response(text=PAGE.format(name=self.name), content_type="text/html", headers=headers)
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get(PAGE_PATH, self.handle)
+        return app
+
+
+@pytest.fixture
+def extractions(monkeypatch, tmp_path):
+    # Кэш в отдельном каталоге, разбор страниц — в этом же процессе и с подсчётом вызовов
+    monkeypatch.setattr(http_cache, "HTTP_CACHE_DIR", str(tmp_path))
+    calls = []
+
+    async def run_inline(func, *args):
+        calls.append(args[1])
+        return func(*args)
+
+    monkeypatch.setattr(parser, "run_in_pool", run_inline)
+    return calls
+
+
+async def crawl(site: DishSite, times: int = 1) -> list:
+    server = TestServer(site.build_app())
+    await server.start_server()
+    url = str(server.make_url(PAGE_PATH))
+    try:
+        async with ClientSession() as session:
+            return [
+                await parser.parse_item(url, session, "Завтраки", 3, asyncio.Semaphore(1), 7)
+                for _ in range(times)
+            ]
+    finally:
+        await server.close()
+
+
+def test_200_stores_etag_and_body_hash(extractions):
+    site = DishSite()
+    [item] = asyncio.run(crawl(site))
+
+    assert item["Название"] == "Сырники" and item["SKU"] == 501 and item["restaurant_id"] == 7
+    assert len(extractions) == 1
+    entry = asyncio.run(http_cache.load_entry(extractions[0]))
+    assert entry["etag"] == '"v1"'
+    assert entry["body_hash"] == http_cache.body_hash(PAGE.format(name="Сырники"))
+    assert entry["item"]["Название"] == "Сырники"
+    assert "If-None-Match" not in site.requests[0]
+
+
+def test_304_returns_cached_item_without_extraction(extractions):
+    site = DishSite()
+    first, second = asyncio.run(crawl(site, times=2))
+
+    assert site.requests[1]["If-None-Match"] == '"v1"'
+    assert len(site.requests) == 2
+    assert len(extractions) == 1
+    assert second == first
+
+
+def test_unchanged_body_skips_extraction(extractions):
+    # Сервер без ETag: условного запроса нет, совпадение определяется по хэшу тела
+    site = DishSite()
+    site.send_etag = False
+    first, second = asyncio.run(crawl(site, times=2))
+
+    assert "If-None-Match" not in site.requests[1]
+    assert len(extractions) == 1
+    assert second == first
+
+
+def test_changed_body_is_extracted_again(extractions):
+    site = DishSite()
+    asyncio.run(crawl(site))
+    site.name, site.etag = "Сырники с вареньем", '"v2"'
+    [item] = asyncio.run(crawl(site))
+
+    assert len(extractions) == 2
+    assert item["Название"] == "Сырники с вареньем"
+    entry = asyncio.run(http_cache.load_entry(extractions[1]))
+    assert entry["etag"] == '"v2"'
+    assert entry["item"]["Название"] == "Сырники с вареньем"
+
+
+def test_304_without_validators_is_not_retried_or_parsed(extractions):
+    site = DishSite()
+    site.force_status = 304
+    [item] = asyncio.run(crawl(site))
+
+    assert item is None
+    assert len(site.requests) == 1
+    assert not extractions
+    assert "If-None-Match" not in site.requests[0]
+
+
+def test_cached_item_of_other_extractor_is_extracted_again(extractions, monkeypatch):
+    site = DishSite()
+    asyncio.run(crawl(site))
+    other = "bs4" if parser.resolve_extractor() == "lxml" else "lxml"
+    monkeypatch.setattr(parser, "resolve_extractor", lambda: other)
+    asyncio.run(crawl(site))
+
+    assert "If-None-Match" not in site.requests[1]
+    assert len(extractions) == 2
+    assert asyncio.run(http_cache.load_entry(extractions[1]))["extractor"] == other
@@ -0,0 +1,175 @@
+import io
+import os
+import asyncio
+
+import pytest
+
+pytest.importorskip("PIL")
+
+from PIL import Image
+from aiohttp import web, ClientSession
+from aiohttp.test_utils import TestServer
+
+from conftest import TEST_DATABASE_URL
+import http_cache
+import image_mirror
+import photo_cache
+
+IMAGE_PATH = "/img/syrniki.png"
+
+
+def png(color: str) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class ImageHost:
+    # Картинка с ETag; на совпавший If-None-Match отвечает 304
+    def __init__(self, color: str = "red", etag: str = '"red"'):
+        self.body = png(color)
+        self.etag = etag
+        self.requests = []
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests.append(dict(request.headers))
+        if self.etag and request.headers.get("If-None-Match") == self.etag:
+            return web.Response(status=304)
+        headers = {"ETag": self.etag} if self.etag else {}
+        return web.Response(body=self.body, content_type="image/png", headers=headers)
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get(IMAGE_PATH, self.handle)
+        return app
+
+
+class NoRateLimit:
+    async def wait(self, url: str):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def local_dirs(monkeypatch, tmp_path):
+    monkeypatch.setattr(http_cache, "HTTP_CACHE_DIR", str(tmp_path / "http_cache"))
+    monkeypatch.setattr(image_mirror, "IMAGE_DIR", str(tmp_path / "images"))
+
+    async def run_inline(func, *args):
+        return func(*args)
+
+    monkeypatch.setattr(image_mirror, "run_in_pool", run_inline)
+
+
+async def with_host(host: ImageHost, scenario):
+    server = TestServer(host.build_app())
+    await server.start_server()
+    try:
+        async with ClientSession() as session:
+            return await scenario(str(server.make_url(IMAGE_PATH)), session)
+    finally:
+        await server.close()
+
+
+async def mirror(url: str, known_hash, session):
+    return await image_mirror.mirror_image(url, known_hash, session, asyncio.Semaphore(1), NoRateLimit())
+
+
+def test_unchanged_image_is_revalidated_with_etag():
+    host = ImageHost()
+
+    async def scenario(url, session):
+        first = await mirror(url, None, session)
+        second = await mirror(url, first[1], session)
+        return first, second
+
+    (url, content_hash, path), second = asyncio.run(with_host(host, scenario))
+    assert os.path.exists(path) and path == image_mirror.image_path(content_hash)
+    assert second is None
+    assert "If-None-Match" not in host.requests[0]
+    assert host.requests[1]["If-None-Match"] == '"red"'
+
+
+def test_changed_image_under_same_url_is_replaced():
+    host = ImageHost()
+
+    async def scenario(url, session):
+        first = await mirror(url, None, session)
+        host.body, host.etag = png("blue"), '"blue"'
+        return first, await mirror(url, first[1], session)
+
+    (_, old_hash, _), (_, new_hash, new_path) = asyncio.run(with_host(host, scenario))
+    assert new_hash != old_hash
+    assert os.path.exists(new_path)
+
+
+def test_same_body_without_validators_is_not_replaced():
+    host = ImageHost(etag="")
+
+    async def scenario(url, session):
+        first = await mirror(url, None, session)
+        return first, await mirror(url, first[1], session)
+
+    _, second = asyncio.run(with_host(host, scenario))
+    assert second is None
+    assert len(host.requests) == 2
+
+
+def test_missing_copy_is_downloaded_again():
+    host = ImageHost()
+
+    async def scenario(url, session):
+        _, content_hash, path = await mirror(url, None, session)
+        os.remove(path)
+        return await mirror(url, content_hash, session), path
+
+    second, path = asyncio.run(with_host(host, scenario))
+    assert "If-None-Match" not in host.requests[1]
+    assert second is None and os.path.exists(path)
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL не задан")
+def test_replaced_image_drops_telegram_file_id():
+    import asyncpg
+    import database
+
+    restaurant_id = 900002
+    host = ImageHost()
+
+    async def scenario(url, session):
+        await database.migrate(TEST_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1))
+        pool = await asyncpg.create_pool(TEST_DATABASE_URL, min_size=1, max_size=2)
+        try:
+            await pool.execute(
+                "INSERT INTO menu (id, restaurant_id, category, category_id, name, image, availability) "
+                "VALUES (1, $1, 'Завтраки', 1, 'Сырники', $2, TRUE)", restaurant_id, url
+            )
+            await image_mirror.mirror_images(pool, session, NoRateLimit())
+            first_hash = await pool.fetchval("SELECT content_hash FROM image_mirror WHERE image_url = $1", url)
+            await photo_cache.remember_file_id(pool, url, "old-file-id")
+
+            # Тот же URL, другая картинка
+            host.body, host.etag = png("blue"), '"blue"'
+            await image_mirror.mirror_images(pool, session, NoRateLimit())
+            second_hash = await pool.fetchval("SELECT content_hash FROM image_mirror WHERE image_url = $1", url)
+            file_id = await pool.fetchval("SELECT file_id FROM telegram_files WHERE image_url = $1", url)
+            return first_hash, second_hash, file_id, photo_cache.file_id_cache.get(url)
+        finally:
+            await pool.execute("DELETE FROM menu WHERE restaurant_id = $1", restaurant_id)
+            await pool.execute("DELETE FROM image_mirror WHERE image_url = $1", url)
+            await pool.execute("DELETE FROM telegram_files WHERE image_url = $1", url)
+            await pool.close()
+
+    first_hash, second_hash, file_id, cached_file_id = asyncio.run(with_host(host, scenario))
+    assert first_hash and second_hash and first_hash != second_hash
+    assert file_id is None and cached_file_id is None
+
+
+def test_images_notification_clears_bot_caches():
+    import catalog_cache
+
+    photo_cache.file_id_cache.set("https://example.com/a.jpg", "file-id")
+    image_mirror.local_path_cache.set("https://example.com/a.jpg", "/tmp/a.jpg")
+    catalog_cache._on_catalog_notification(None, 0, catalog_cache.CATALOG_CHANNEL, catalog_cache.IMAGES_PAYLOAD)
+
+    assert photo_cache.file_id_cache.get("https://example.com/a.jpg") is None
+    assert image_mirror.local_path_cache.get("https://example.com/a.jpg") is None
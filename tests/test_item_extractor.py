@@ -0,0 +1,39 @@
+import os
+import glob
+import json
+
+import pytest
+
+import item_extractor
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dish_pages")
+PAGES = sorted(os.path.splitext(os.path.basename(path))[0] for path in glob.glob(os.path.join(PAGES_DIR, "*.html")))
+PAGE_URL = "https://coffeemania.ru/menu/test"
+
+
+def load_page(name: str):
+    with open(os.path.join(PAGES_DIR, name + ".html"), encoding="utf-8") as f:
+        html = f.read()
+    with open(os.path.join(PAGES_DIR, name + ".json"), encoding="utf-8") as f:
+        expected = json.load(f)
+    return html, expected
+
+
+@pytest.fixture(autouse=True)
+def fixed_base_url(monkeypatch):
+    # Эталоны записаны с адресом сайта по умолчанию
+    monkeypatch.setattr(item_extractor, "BASE_URL", "https://coffeemania.ru")
+
+
+@pytest.mark.parametrize("name", PAGES)
+def test_bs4_matches_golden(name):
+    html, expected = load_page(name)
+    assert item_extractor.extract_item_bs4(html, PAGE_URL) == expected
+
+
+@pytest.mark.parametrize("name", PAGES)
+def test_lxml_matches_golden(name):
+    pytest.importorskip("lxml")
+    html, expected = load_page(name)
+    assert item_extractor.extract_item_lxml(html, PAGE_URL) == expected
+
@@ -0,0 +1,235 @@
+import json
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from conftest import TEST_DATABASE_URL
+
+if not TEST_DATABASE_URL:
+    pytest.skip("TEST_DATABASE_URL не задан", allow_module_level=True)
+
+import asyncpg
+
+import main
+import cart
+import database
+import db_queries
+from catalog_cache import CATEGORIES_INDEX_QUERY
+from fsm_storage import PostgresStorage
+
+# Размер синтетического каталога: на нём планировщик уже не выбирает полное чтение таблиц
+RESTAURANTS = 200
+ITEMS_PER_RESTAURANT = 500
+CATEGORIES_PER_RESTAURANT = 20
+USERS = 20000
+ORDERS_PER_USER = 5
+
+# Таблицы, растущие вместе с каталогом и пользователями; restaurants — 200 строк, его читаем целиком
+LARGE_TABLES = {"menu", "vine_card", "categories", "cart", "orders", "order_lines", "clients", "fsm_states"}
+
+USER_ID = 4242
+RESTAURANT_ID = USER_ID % RESTAURANTS + 1
+CATEGORY_ID = 7
+
+FIXTURE_SQL = [
+    f"""
+    INSERT INTO restaurants (restaurant_id, name)
+    SELECT r, 'Ресторан ' || r FROM generate_series(1, {RESTAURANTS}) r
+    """,
+    *[
+        f"""
+        INSERT INTO {table} (id, restaurant_id, category, category_id, name, price, price_kopecks, availability)
+        SELECT i, r, 'Категория ' || i % {CATEGORIES_PER_RESTAURANT}, i % {CATEGORIES_PER_RESTAURANT},
+               'Позиция ' || md5(r || '-' || i), (100 + i % 900) || ' ₽', (100 + i % 900) * 100, i % 50 <> 0
+        FROM generate_series(1, {RESTAURANTS}) r, generate_series(1, {ITEMS_PER_RESTAURANT}) i
+        """
+        for table in ("menu", "vine_card")
+    ],
+    CATEGORIES_INDEX_QUERY.format(is_wine="FALSE", table="menu", condition="TRUE"),
+    CATEGORIES_INDEX_QUERY.format(is_wine="TRUE", table="vine_card", condition="TRUE"),
+    f"""
+    INSERT INTO clients (user_id, surname, name, patronymic, gender, age, phone)
+    SELECT u, 'Фамилия', 'Имя ' || u, 'Отчество', 'Мужской', 20 + u % 50, '+7900' || u
+    FROM generate_series(1, {USERS}) u
+    """,
+    f"""
+    INSERT INTO cart (user_id, item_id, restaurant_id, item_name, price, is_wine, count)
+    SELECT u, i, u % {RESTAURANTS} + 1, 'Позиция ' || i, 10000, i = 3, 1
+    FROM generate_series(1, {USERS}) u, generate_series(1, 3) i
+    """,
+    f"""
+    INSERT INTO orders (user_id, restaurant_id, menu_items, wine_items, count, payment_date)
+    SELECT u, u % {RESTAURANTS} + 1, 'Позиция 1 (x1)', '', 2, now() - make_interval(days => n)
+    FROM generate_series(1, {USERS}) u, generate_series(1, {ORDERS_PER_USER}) n
+    """,
+    """
+    INSERT INTO order_lines (order_id, line_no, user_id, restaurant_id, item_id, item_name, is_wine, price, count)
+    SELECT order_id, n, user_id, restaurant_id, n, 'Позиция ' || n, FALSE, 10000, 1
+    FROM orders, generate_series(1, 2) n
+    """,
+    f"""
+    INSERT INTO fsm_states (key, state, data)
+    SELECT '1:' || u || ':' || u || ':None:None:default', NULL, '{{}}'::jsonb
+    FROM generate_series(1, {USERS}) u
+    """,
+    "ANALYZE",
+]
+
+
+async def load_catalog():
+    conn = await asyncpg.connect(TEST_DATABASE_URL)
+    try:
+        tables = ", ".join(database.Base.metadata.tables)
+        await conn.execute(f"DROP TABLE IF EXISTS {tables} CASCADE")
+    finally:
+        await conn.close()
+    await database.migrate(TEST_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1))
+    conn = await asyncpg.connect(TEST_DATABASE_URL)
+    try:
+        for statement in FIXTURE_SQL:
+            await conn.execute(statement)
+    finally:
+        await conn.close()
+
+
+@pytest.fixture(scope="module", autouse=True)
+def catalog():
+    asyncio.run(load_catalog())
+
+
+class RecordingConnection:
+    # Пропускает запросы в настоящее соединение и запоминает текст и аргументы для EXPLAIN
+    def __init__(self, conn, statements: list):
+        self.conn = conn
+        self.statements = statements
+
+    async def _run(self, method: str, query: str, *args):
+        self.statements.append((query, args))
+        return await getattr(self.conn, method)(query, *args)
+
+    async def fetch(self, query, *args):
+        return await self._run("fetch", query, *args)
+
+    async def fetchrow(self, query, *args):
+        return await self._run("fetchrow", query, *args)
+
+    async def fetchval(self, query, *args):
+        return await self._run("fetchval", query, *args)
+
+    async def execute(self, query, *args):
+        return await self._run("execute", query, *args)
+
+
+class RecordingPool:
+    def __init__(self, conn):
+        self.conn = conn
+        self.statements = []
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield RecordingConnection(self.conn, self.statements)
+
+
+async def second_history_page():
+    history = await cart.get_order_history(USER_ID, limit=2)
+    return await cart.get_order_history(USER_ID, before_order_id=history["orders"][-1]["order_id"], limit=2)
+
+
+# Горячие запросы бота: сценарий вызывает настоящую функцию модуля, рядом — индексы,
+# которые обязаны появиться в её планах
+SCENARIOS = {
+    "main.user_exists_reg": (
+        lambda pool: main.user_exists_reg(USER_ID), {"clients_pkey"}),
+    "main.fetch_menu_categories": (
+        lambda pool: main.fetch_menu_categories(RESTAURANT_ID), {"ix_categories_listing"}),
+    "main.fetch_wine_categories": (
+        lambda pool: main.fetch_wine_categories(RESTAURANT_ID), {"ix_categories_listing"}),
+    "main.fetch_items_page[menu]": (
+        lambda pool: main.fetch_items_page(RESTAURANT_ID, CATEGORY_ID), {"ix_menu_category_listing"}),
+    "main.fetch_items_page[menu, next]": (
+        lambda pool: main.fetch_items_page(RESTAURANT_ID, CATEGORY_ID, False, "n", CATEGORY_ID),
+        {"ix_menu_category_listing", "menu_pkey"}),
+    "main.fetch_items_page[menu, prev]": (
+        lambda pool: main.fetch_items_page(RESTAURANT_ID, CATEGORY_ID, False, "p", 307),
+        {"ix_menu_category_listing", "menu_pkey"}),
+    "main.fetch_items_page[wine]": (
+        lambda pool: main.fetch_items_page(RESTAURANT_ID, CATEGORY_ID, True), {"ix_vine_card_category_listing"}),
+    "main.get_restaurant_info": (
+        lambda pool: main.get_restaurant_info(RESTAURANT_ID), set()),
+    "cart.add_item_to_cart[new]": (
+        lambda pool: cart.add_item_to_cart(USER_ID, RESTAURANT_ID, 10, False), {"uq_cart_position", "menu_pkey"}),
+    "cart.add_item_to_cart[existing]": (
+        lambda pool: cart.add_item_to_cart(USER_ID, RESTAURANT_ID, 1, False), {"uq_cart_position", "menu_pkey"}),
+    "cart.get_cart_items": (
+        lambda pool: cart.get_cart_items(USER_ID), {"uq_cart_position"}),
+    "cart.find_unavailable_items": (
+        lambda pool: cart.find_unavailable_items([
+            {"item_id": 1, "restaurant_id": RESTAURANT_ID, "is_wine": False},
+            {"item_id": 3, "restaurant_id": RESTAURANT_ID, "is_wine": True},
+        ]),
+        {"menu_pkey", "vine_card_pkey"}),
+    "cart.remove_item_from_cart": (
+        lambda pool: cart.remove_item_from_cart(USER_ID, RESTAURANT_ID, 1, 1, False), {"uq_cart_position"}),
+    "cart.clear_cart": (
+        lambda pool: cart.clear_cart(USER_ID), {"uq_cart_position"}),
+    "cart.save_order_from_cart": (
+        lambda pool: cart.save_order_from_cart(USER_ID), {"uq_cart_position"}),
+    "cart.get_order_history": (
+        lambda pool: cart.get_order_history(USER_ID), {"ix_orders_user_payment_date", "order_lines_pkey"}),
+    "cart.get_order_history[before]": (
+        lambda pool: second_history_page(), {"ix_orders_user_payment_date", "orders_pkey", "order_lines_pkey"}),
+    "db_queries.get_menu_item_by_id": (
+        lambda pool: db_queries.get_menu_item_by_id(pool, RESTAURANT_ID, 42), {"menu_pkey"}),
+    "db_queries.get_wine_item_by_id": (
+        lambda pool: db_queries.get_wine_item_by_id(pool, RESTAURANT_ID, 42), {"vine_card_pkey"}),
+    "db_queries.get_items_by_ids": (
+        lambda pool: db_queries.get_items_by_ids(pool, RESTAURANT_ID, [1, 2, 3, 42]), {"menu_pkey"}),
+    "fsm_storage.PostgresStorage._fetch": (
+        lambda pool: PostgresStorage(pool)._fetch(f"1:{USER_ID}:{USER_ID}:None:None:default"), {"fsm_states_pkey"}),
+}
+
+
+def plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+async def explain_scenario(name: str) -> list:
+    conn = await asyncpg.connect(TEST_DATABASE_URL)
+    transaction = conn.transaction()
+    await transaction.start()
+    try:
+        pool = RecordingPool(conn)
+        main.db_pool = pool
+        main.profile_cache.clear()
+        cart.set_db_pool(pool)
+        scenario, _ = SCENARIOS[name]
+        await scenario(pool)
+        plans = []
+        for query, args in pool.statements:
+            explained = await conn.fetchval(f"EXPLAIN (FORMAT JSON) {query}", *args)
+            plans.append((query, json.loads(explained)[0]["Plan"]))
+        return plans
+    finally:
+        await transaction.rollback()
+        await conn.close()
+
+
+@pytest.mark.parametrize("name", list(SCENARIOS))
+def test_hot_query_uses_indexes(name):
+    plans = asyncio.run(explain_scenario(name))
+    assert plans, f"{name} не выполнил ни одного запроса"
+    used_indexes = set()
+    for query, plan in plans:
+        nodes = list(plan_nodes(plan))
+        used_indexes.update(node["Index Name"] for node in nodes if "Index Name" in node)
+        seq_scans = [
+            node["Relation Name"] for node in nodes
+            if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in LARGE_TABLES
+        ]
+        assert not seq_scans, f"{name}: полное чтение {seq_scans} в запросе\n{query}\n{json.dumps(plan, indent=2)}"
+    _, expected_indexes = SCENARIOS[name]
+    missing = expected_indexes - used_indexes
+    assert not missing, f"{name}: в планах нет индексов {missing}, использованы {used_indexes}"
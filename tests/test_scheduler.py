@@ -0,0 +1,56 @@
+import time
+import asyncio
+
+from aiogram import Dispatcher
+from aiogram.types import Message, Update
+
+from scheduler import UpdateLimitMiddleware
+from benchmarks.fake_telegram import UpdateFactory, make_bot
+
+
+async def feed_burst(updates: list, max_concurrency: int):
+    limiter = UpdateLimitMiddleware(max_concurrency)
+    dp = Dispatcher(events_isolation=limiter.isolation)
+    dp.update.outer_middleware(limiter)
+    release = asyncio.Event()
+    handled = []
+
+    @dp.message()
+    async def slow(message: Message):
+        handled.append(message.text)
+        await release.wait()
+
+    # Бот не отправляет запросов: обработчик ничего не отвечает
+    bot = make_bot("http://127.0.0.1:9")
+    tasks = [
+        asyncio.create_task(dp.feed_update(bot, Update.model_validate(update, context={"bot": bot})))
+        for update in updates
+    ]
+    await asyncio.sleep(0.05)
+    snapshot = (limiter.active, limiter.waiting_user, limiter.waiting_slot, limiter.max_queued)
+    release.set()
+    await asyncio.gather(*tasks)
+    await bot.session.close()
+    return snapshot, handled, limiter
+
+
+def test_queue_counts_updates_waiting_for_the_same_user():
+    factory = UpdateFactory()
+    updates = [factory.message(1, f"сообщение {n}") for n in range(5)]
+
+    (active, waiting_user, waiting_slot, max_queued), handled, limiter = asyncio.run(feed_burst(updates, 10))
+
+    # Свободных слотов много, но обновления одного пользователя ждут друг друга — и это видно в очереди
+    assert (active, waiting_user, waiting_slot, max_queued) == (1, 4, 0, 4)
+    assert handled == [f"сообщение {n}" for n in range(5)]
+    assert limiter.queued == 0 and limiter.active == 0
+
+
+def test_queue_counts_updates_waiting_for_a_slot():
+    factory = UpdateFactory()
+    updates = [factory.message(user_id, "привет") for user_id in range(1, 6)]
+
+    (active, waiting_user, waiting_slot, max_queued), handled, _ = asyncio.run(feed_burst(updates, 2))
+
+    assert (active, waiting_user, waiting_slot, max_queued) == (2, 0, 3, 3)
+    assert len(handled) == 5
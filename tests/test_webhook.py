@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiogram")
+
+from aiohttp.test_utils import TestServer
+from aiogram import Dispatcher, F
+from aiogram.types import Message, CallbackQuery
+
+import webhook
+from benchmarks.fake_telegram import FakeBotApi, UpdateFactory, make_bot, replay
+
+
+def make_dispatcher(handler_delay: float = 0) -> Dispatcher:
+    dp = Dispatcher()
+
+    @dp.message()
+    async def echo(message: Message):
+        await asyncio.sleep(handler_delay)
+        await message.answer(f"echo: {message.text}")
+
+    @dp.callback_query(F.data)
+    async def on_callback(callback: CallbackQuery):
+        await callback.answer(callback.data)
+
+    return dp
+
+
+async def run_replay(updates: list, secret: str = "", handler_delay: float = 0):
+    api = FakeBotApi()
+    api_server = TestServer(api.build_app())
+    await api_server.start_server()
+    bot = make_bot(str(api_server.make_url("")))
+    dp = make_dispatcher(handler_delay)
+    server = webhook.WebhookServer(dp, bot)
+    webhook_server = TestServer(server.build_app())
+    await webhook_server.start_server()
+    try:
+        url = str(webhook_server.make_url(webhook.WEBHOOK_PATH))
+        results = await replay(url, updates, secret=secret)
+        return api, server, webhook_server, results
+    finally:
+        # Остановка сервера ждёт обновления, которые ещё обрабатываются
+        await webhook_server.close()
+        await bot.session.close()
+        await api_server.close()
+
+
+def test_replayed_updates_reach_handlers():
+    factory = UpdateFactory()
+    updates = [factory.message(user_id, f"привет {user_id}") for user_id in range(1, 21)]
+    updates += [factory.callback(user_id, f"menu:{user_id}") for user_id in range(1, 6)]
+
+    api, server, _, results = asyncio.run(run_replay(updates, handler_delay=0.01))
+
+    assert all(status == 200 for _, status, _, _ in results)
+    assert sorted(p["text"] for p in api.calls_of("sendMessage")) == sorted(f"echo: привет {i}" for i in range(1, 21))
+    assert len(api.calls_of("answerCallbackQuery")) == 5
+    assert not server.tasks
+
+
+def test_shutdown_waits_for_in_flight_updates():
+    factory = UpdateFactory()
+    updates = [factory.message(1, "медленно")]
+
+    # Обработчик дольше, чем ответ webhook: на момент остановки обновление ещё в работе
+    api, server, _, _ = asyncio.run(run_replay(updates, handler_delay=0.3))
+
+    assert [p["text"] for p in api.calls_of("sendMessage")] == ["echo: медленно"]
+    assert not server.tasks
+
+
+def test_wrong_secret_is_rejected(monkeypatch):
+    monkeypatch.setattr(webhook, "WEBHOOK_SECRET", "s3cret")
+    factory = UpdateFactory()
+
+    api, _, _, results = asyncio.run(run_replay([factory.message(1, "a")], secret="wrong"))
+    assert [status for _, status, _, _ in results] == [401]
+    assert not api.calls
+
+    api, _, _, results = asyncio.run(run_replay([factory.message(1, "b")], secret="s3cret"))
+    assert [status for _, status, _, _ in results] == [200]
+    assert len(api.calls_of("sendMessage")) == 1
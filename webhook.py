@@ -0,0 +1,75 @@
+import asyncio
+import signal
+import logging
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from config1 import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    def __init__(self, dp: Dispatcher, bot: Bot):
+        self.dp = dp
+        self.bot = bot
+        self.tasks = set()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET and request.headers.get(SECRET_HEADER) != WEBHOOK_SECRET:
+            return web.Response(status=401)
+        update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        # Telegram получает ответ сразу, обработка идёт в фоне; число одновременно обрабатываемых
+        # обновлений ограничивает UpdateLimitMiddleware диспетчера, ожидающие видны в его статистике
+        task = asyncio.create_task(self.process(update))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return web.Response()
+
+    async def process(self, update: Update):
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            logger.exception(f"Ошибка при обработке обновления {update.update_id}: {e}")
+
+    async def on_shutdown(self, app: web.Application):
+        if self.tasks:
+            logger.info(f"Ожидаем завершения {len(self.tasks)} обновлений...")
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(WEBHOOK_PATH, self.handle)
+        app.on_shutdown.append(self.on_shutdown)
+        return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    server = WebhookServer(dp, bot)
+    runner = web.AppRunner(server.build_app())
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    await dp.emit_startup(bot=bot)
+    try:
+        await site.start()
+        if WEBHOOK_URL:
+            await bot.set_webhook(
+                WEBHOOK_URL + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET or None,
+                allowed_updates=dp.resolve_used_update_types()
+            )
+        logger.info(f"Webhook-сервер слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+        await stop_event.wait()
+    finally:
+        logger.info("Остановка webhook-сервера...")
+        await runner.cleanup()
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()